@@ -0,0 +1,87 @@
+"""
+Page load comparison of the default and the lean(--lean) chrome profile of yelp_proc.get_driver.
+Each url is loaded in both browsers with an empty cache. Prints bytes, requests and load time
+per page and what the lean profile saves. Unlike the other benchmarks it loads the given urls,
+so use saved pages behind a local server(python -m http.server) to stay off yelp.com.
+
+Command : python bench_browser.py -i <url file> -n <rounds>
+"""
+import argparse
+import os
+import sys
+import time
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'yelp'))
+from yelp_proc import get_driver
+from lean_browser import page_metrics
+
+
+def load(driver, url):
+    # load time in seconds and page metrics, as load_page of yelp_proc waits for the page
+
+    driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+    start = time.time()
+    driver.get(url)
+    try:
+        WebDriverWait(driver, 100).until(EC.presence_of_element_located((By.XPATH, '//div[contains(@class, "main-content-wrap")]')))
+    except TimeoutException:
+        pass
+    seconds = time.time() - start
+    metrics = page_metrics(driver) or {'bytes': 0, 'requests': 0}
+    return seconds, metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='default and lean chrome profile page loads')
+    parser.add_argument('-i', '--input', help='file with a url in each line', required=True)
+    parser.add_argument('-n', '--rounds', type=int, default=1, help='rounds over the urls. default: 1')
+    args = parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as f:
+        urls = [line.strip() for line in f if line.strip()]
+    if len(urls) == 0:
+        print ("No urls in", args.input)
+        sys.exit(0)
+
+    drivers = {'default': get_driver(False), 'lean': get_driver(False, True)}
+    totals = {}
+    for name in drivers:
+        totals[name] = {'pages': 0, 'bytes': 0, 'requests': 0, 'seconds': 0.0}
+
+    try:
+        for i in range(args.rounds):
+            for url in urls:
+                row = []
+                # alternate the order, so neither profile always goes first
+                names = ['default', 'lean'] if i % 2 == 0 else ['lean', 'default']
+                for name in names:
+                    seconds, metrics = load(drivers[name], url)
+                    total = totals[name]
+                    total['pages'] += 1
+                    total['bytes'] += metrics['bytes']
+                    total['requests'] += metrics['requests']
+                    total['seconds'] += seconds
+                    row.append("{} {:.1f} KB {} requests {:.2f}s".format(
+                        name, metrics['bytes'] / 1024.0, metrics['requests'], seconds))
+                print (url, ":", ", ".join(sorted(row)))
+    finally:
+        for driver in drivers.values():
+            driver.quit()
+
+    average = {}
+    for name in totals:
+        total = totals[name]
+        pages = float(total['pages'])
+        average[name] = (total['bytes'] / 1024.0 / pages, total['requests'] / pages, total['seconds'] / pages)
+        print ("{:8} : {:.1f} KB, {:.1f} requests, {:.2f}s per page".format(name, *average[name]))
+
+    saved_kb = average['default'][0] - average['lean'][0]
+    saved_seconds = average['default'][2] - average['lean'][2]
+    print ("saved    : {:.1f} KB({:.0f}%), {:.2f}s({:.0f}%) per page".format(
+        saved_kb, saved_kb / average['default'][0] * 100 if average['default'][0] else 0,
+        saved_seconds, saved_seconds / average['default'][2] * 100 if average['default'][2] else 0))
@@ -0,0 +1,107 @@
+"""
+Benchmark of the email extraction on large pages.
+Compares the former find_mail_address/is_valid of yelp_proc with email_extract,
+on the decoded page and on its raw bytes.
+
+Command : python bench_email.py -i <directory of saved pages> -n <rounds>
+Command(generated) : python bench_email.py -a 5000 -n <rounds>
+"""
+import argparse
+import glob
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'yelp'))
+import email_extract
+
+
+def find_mail_address_before(html_corpus=None):
+    emails = re.findall(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]{2,3}", html_corpus)
+    result = []
+    for email in emails:
+        if email.lower() not in result:
+            result.append(email.lower())
+    return result
+
+
+def is_valid_before(email):
+    regex = r'^\w+([\.-]?\w+)*@\w+([\.-]?\w+)*(\.\w{2,3})+$'
+    if(re.search(regex,email)):
+        return True
+    else:
+        return False
+
+
+def extract_before(page):
+    text = page.decode('utf-8', 'replace')
+    return [email for email in find_mail_address_before(text) if is_valid_before(email)]
+
+
+def extract_after(page):
+    text = page.decode('utf-8', 'replace')
+    emails = email_extract.find_mail_address(text)
+    valid = email_extract.validate_batch(emails)
+    return [email for email in emails if email in valid]
+
+
+def extract_after_bytes(page):
+    emails = email_extract.find_mail_address(page)
+    valid = email_extract.validate_batch(emails)
+    return [email for email in emails if email in valid]
+
+
+def make_directory_page(addresses):
+    """
+    Build a directory page listing the addresses, each one repeated in a mailto link
+    """
+    rows = []
+    for i in range(addresses):
+        email = "Member.{}@Company{}.com".format(i, i % 97)
+        rows.append('<tr><td>Member {0}</td><td><a href="mailto:{1}">{1}</a></td><td>{2}</td></tr>'.format(
+            i, email, 'lorem ipsum dolor sit amet ' * random.randint(1, 6)))
+    return ('<html><body><table>' + ''.join(rows) + '</table></body></html>').encode('utf-8')
+
+
+def run(name, extract, pages, rounds):
+    size = sum(len(page) for page in pages) * rounds
+    start = time.perf_counter()
+    for i in range(rounds):
+        for page in pages:
+            extract(page)
+    elapsed = time.perf_counter() - start
+    print ("{:12s}: {:.3f}s, {:.1f} MB/s".format(name, elapsed, size / elapsed / 1e6))
+    return elapsed
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark of the email extraction')
+    parser.add_argument('-i', '--input', type=str, help='directory of saved pages(*.html)')
+    parser.add_argument('-a', '--addresses', type=int, default=5000, help='addresses of the generated page. default: 5000')
+    parser.add_argument('-n', '--rounds', type=int, default=3, help='rounds over the pages. default: 3')
+    args = parser.parse_args()
+
+    if args.input:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.input, '*.html'))):
+            with open(path, 'rb') as f:
+                pages.append(f.read())
+    else:
+        pages = [make_directory_page(args.addresses)]
+
+    if len(pages) == 0:
+        print ("No .html pages in", args.input)
+        sys.exit(-1)
+
+    print ("{} pages, {:.1f} MB".format(len(pages), sum(len(page) for page in pages) / 1e6))
+    for page in pages:
+        if extract_before(page) != extract_after(page) or extract_after(page) != extract_after_bytes(page):
+            print ("Extractors disagree on a page")
+
+    before = run("before", extract_before, pages, args.rounds)
+    after = run("after", extract_after, pages, args.rounds)
+    after_bytes = run("after bytes", extract_after_bytes, pages, args.rounds)
+    print ("speedup : {:.1f}x, {:.1f}x on bytes".format(before / after, before / after_bytes))
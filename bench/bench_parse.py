@@ -0,0 +1,118 @@
+"""
+Micro-benchmark of the business page parsing in yelp_proc.get_business_website_url.
+Compares the former BeautifulSoup + etree parsing with the ld+json fast path and the
+single lxml parse of biz_parser on saved business pages(driver.page_source saved as .html files).
+Pages rated above the threshold are rejected, as in the scraper.
+
+Command : python bench_parse.py -i <directory of saved pages> -n <rounds> -r <rating threshold>
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'yelp'))
+import biz_parser
+
+
+RATING_THRESHOLD = 4.5
+
+
+def parse_before(page_source):
+    # parsing of get_business_website_url before the fast path and the single parse
+
+    soup = BeautifulSoup(page_source, 'lxml')
+    tree = etree.HTML(page_source)
+
+    jsonItems = soup.find_all("script", {"type": "application/ld+json"})
+    if len(jsonItems) == 0:
+        return None
+    bizObj = json.loads(jsonItems[-1].text.strip())
+
+    ratingValue = 5.0
+    if 'aggregateRating' in bizObj:
+        if 'ratingValue' in bizObj['aggregateRating']:
+            ratingValue = float(bizObj['aggregateRating']['ratingValue'])
+    if ratingValue > RATING_THRESHOLD:
+        return None
+
+    def itemprop(name):
+        try:
+            return soup.find('span', {'itemprop': name}).text.strip()
+        except:
+            return ''
+
+    def hidden_meta(name):
+        try:
+            return soup.find('div', {'class': 'hidden'}).find('meta', {'itemprop': name})['content']
+        except:
+            return ''
+
+    address_ = [itemprop('streetAddress'), itemprop('addressLocality'),
+                itemprop('addressRegion'), itemprop('postalCode')]
+    link = soup.find('a', {'rel': 'noopener'})
+    return {
+        "business_name": hidden_meta('name'),
+        "price_range": hidden_meta('priceRange'),
+        "category": ', '.join(tree.xpath('//a[contains(@href, "/c/")]/text()')),
+        "phone": itemprop('telephone'),
+        "address": ' '.join(address_).strip(),
+        "reviews": itemprop('reviewCount'),
+        "claimed": len(tree.xpath('//span[contains(@class, "checkmark-badged")]')) > 0,
+        "website_link": link.get('href', '') if link else ''
+    }
+
+
+def parse_after(page_source):
+    ratingValue = biz_parser.get_rating(page_source)
+    if ratingValue is None or ratingValue > RATING_THRESHOLD:
+        return None
+    return biz_parser.get_business_fields(biz_parser.parse_page(page_source))
+
+
+def run(name, parse, pages, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        for page in pages:
+            parse(page)
+    elapsed = time.perf_counter() - start
+    count = len(pages) * rounds
+    print ("{:8s}: {} pages in {:.2f}s, {:.1f} pages/s".format(name, count, elapsed, count / elapsed))
+    return count / elapsed
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark of the business page parsing')
+    parser.add_argument('-i', '--input', type=str, required=True, help='directory of saved business pages(*.html)')
+    parser.add_argument('-n', '--rounds', type=int, default=5, help='rounds over the pages. default: 5')
+    parser.add_argument('-r', '--rating', type=float, default=4.5, help='rating threshold. default: 4.5')
+    args = parser.parse_args()
+
+    RATING_THRESHOLD = args.rating
+
+    pages = []
+    for path in sorted(glob.glob(os.path.join(args.input, '*.html'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append(f.read())
+    if len(pages) == 0:
+        print ("No .html pages in", args.input)
+        sys.exit(-1)
+
+    # both parsers must keep the same pages and extract the same fields
+    rejected = 0
+    for page in pages:
+        if parse_after(page) is None:
+            rejected += 1
+        if parse_before(page) != parse_after(page):
+            print ("Parsers disagree on a page:", parse_before(page), parse_after(page))
+    print ("{} pages, {} rejected by rating".format(len(pages), rejected))
+
+    before = run("before", parse_before, pages, args.rounds)
+    after = run("after", parse_after, pages, args.rounds)
+    print ("speedup : {:.1f}x".format(after / before))
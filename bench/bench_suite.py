@@ -0,0 +1,372 @@
+"""
+Repeatable offline benchmarks of the scraping stages and the command line scripts,
+on the page corpus served by corpus_server.py with the given latency and error rates.
+Reports pages/s, p50/p99 latency and the peak RSS of each case, each case runs in a process of its own.
+
+Cases:
+    get_business_links         search page soup and links(yelpsearch.parse_search_page), latency per page
+    find_mail_address          email_extract.find_mail_address on the website pages, latency per page
+    extract_mail_add           yelp_proc.EmailScraper.extract_mail_add over http, latency per website
+    get_business_website_url   yelp_proc.get_business_website_url, plain http fetch, the emails crawled
+                               in the background, latency per business page(fetch and parse)
+    yelp_proc_req              yelp_proc_req.py, threads
+    yelp_proc_req_async        yelp_proc_req.py -m async
+    yelp_proc                  yelp_proc.py -f hybrid
+    pipeline                   pipeline.py --stages biz,email,output
+The latency of the scripts is from the request of a business page to its row in the output.
+
+Command : python bench_suite.py -n 200 -t 4 --latency 0.05 --jitter 0.5 --error-rate 0.01
+Command(some cases) : python bench_suite.py -c find_mail_address,get_business_website_url -n 500 --json results.json
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+YELP = os.path.join(BENCH, '..', 'yelp')
+YELP_SEARCH = os.path.join(BENCH, '..', 'yelp-search')
+CORPUS = os.path.join(BENCH, 'corpus')
+
+CASES = ['get_business_links', 'find_mail_address', 'extract_mail_add', 'get_business_website_url',
+         'yelp_proc_req', 'yelp_proc_req_async', 'yelp_proc', 'pipeline']
+SCRIPTS = ['yelp_proc_req', 'yelp_proc_req_async', 'yelp_proc', 'pipeline']
+
+# the number of business page n, in its url and in the url of its website
+BIZ_NUMBER = re.compile(r'/biz/[^/]+-(\d+)$')
+SITE_NUMBER = re.compile(r'www\.biz-site-(\d+)\.test')
+
+
+def percentile(values, fraction):
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def result(items, per, seconds, latencies, rss_kb=None):
+    return {"items": items, "per": per, "seconds": round(seconds, 3),
+            "p50": round(percentile(latencies, 0.5) * 1000, 2), "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "rss_kb": rss_kb}
+
+
+def read_pages(pattern, count, binary=False):
+    # the pages of the corpus, repeated up to count
+    pages = []
+    for path in sorted(glob.glob(os.path.join(CORPUS, pattern), recursive=True)):
+        with open(path, 'rb') as f:
+            page = f.read()
+        pages.append(page if binary else page.decode('utf-8'))
+    return [pages[i % len(pages)] for i in range(count)]
+
+
+def timed(urls, latencies):
+    # the time from handing out a url to the next request of the same worker
+    for url in urls:
+        start = time.perf_counter()
+        yield url
+        latencies.append(time.perf_counter() - start)
+
+
+def run_get_business_links(args):
+    import yelpsearch
+
+    pages = read_pages('search/*.html', args.pages)
+    latencies = []
+    start = time.perf_counter()
+    for page in pages:
+        t = time.perf_counter()
+        yelpsearch.parse_search_page(page)
+        latencies.append(time.perf_counter() - t)
+    return result(len(pages), 'page', time.perf_counter() - start, latencies)
+
+
+def run_find_mail_address(args):
+    from email_extract import find_mail_address
+
+    pages = read_pages('sites/**/*.html', args.pages, binary=True)
+    latencies = []
+    start = time.perf_counter()
+    for page in pages:
+        t = time.perf_counter()
+        find_mail_address(page)
+        latencies.append(time.perf_counter() - t)
+    return result(len(pages), 'page', time.perf_counter() - start, latencies)
+
+
+def configure_scraper():
+    # the site rate of the scrapers would pace the benchmark, not the code
+    import http_client
+    import yelp_proc
+    from rate_limiter import RateLimiter
+    from spamtrap import SpamtrapMatcher
+
+    http_client.configure(limiter=RateLimiter(10000, 10000))
+    yelp_proc.spamtraps = SpamtrapMatcher('spamtraps.txt', 0)
+    return yelp_proc
+
+
+def run_extract_mail_add(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from parse_pool import ParsePool
+    yelp_proc = configure_scraper()
+
+    # about 5 pages a website
+    sites = max(1, args.pages // 5)
+    page_pool = ThreadPoolExecutor(max_workers=4)
+    parsers = ParsePool(args.parsers)
+    parsers.start()
+
+    pages = 0
+    latencies = []
+    start = time.perf_counter()
+    for i in range(sites):
+        t = time.perf_counter()
+        scraper = yelp_proc.EmailScraper('http://www.biz-site-{}.test/'.format(i), page_pool, None, 4, parsers)
+        scraper.extract_mail_add()
+        latencies.append(time.perf_counter() - t)
+        pages += scraper.cnt
+    seconds = time.perf_counter() - start
+    page_pool.shutdown()
+    parsers.shutdown()
+    return result(pages, 'site', seconds, latencies)
+
+
+def run_get_business_website_url(args):
+    from multiprocessing.pool import ThreadPool
+    from domain_cache import DomainEmailCache
+    from hybrid_fetch import HybridFetcher
+    from output_writer import OutputWriter
+    from parse_pool import ParsePool
+    from result_sink import CsvSink
+    from scheduler import JobQueue
+    yelp_proc = configure_scraper()
+
+    with open(args.urls_file, 'r', encoding='utf-8') as f:
+        urls = [line.strip() for line in f if line.strip()]
+
+    parsers = ParsePool(args.parsers)
+    parsers.start()
+    # plain http only, there is no browser to fall back to
+    fetch = HybridFetcher(lambda page_url: None)
+    crawler = yelp_proc.EmailCrawler(8, 4, DomainEmailCache(), parsers)
+    output = OutputWriter(CsvSink(io.StringIO()))
+
+    latencies = []
+    job_queue = JobQueue(urls)
+    params = [{"urls": timed(job_queue.jobs("worker-{}".format(i + 1)), latencies), "fetch": fetch, "output": output,
+               "crawler": crawler, "journal": None, "parsers": parsers, "verbose": False} for i in range(args.threads)]
+
+    start = time.perf_counter()
+    pool = ThreadPool(args.threads)
+    pool.map(yelp_proc.get_business_website_url, params)
+    pool.close()
+    pool.join()
+    crawler.shutdown()
+    output.close()
+    seconds = time.perf_counter() - start
+    parsers.shutdown()
+    return result(len(urls), 'page', seconds, latencies)
+
+
+def script_command(case, args, output_path):
+    python = sys.executable
+    threads = str(args.threads)
+    parsers = str(args.parsers)
+    if case == 'yelp_proc_req':
+        return [python, 'yelp_proc_req.py', '-i', args.urls_file, '-o', output_path, '-t', threads, '-s', '1', '-r', '10000',
+                '--parsers', parsers]
+    if case == 'yelp_proc_req_async':
+        return [python, 'yelp_proc_req.py', '-i', args.urls_file, '-o', output_path, '-m', 'async', '-c', str(args.concurrency),
+                '-s', '1', '-r', '10000', '--parsers', parsers]
+    if case == 'yelp_proc':
+        return [python, 'yelp_proc.py', '-i', args.urls_file, '-o', output_path, '-t', str(min(args.threads, 5)), '-f', 'hybrid',
+                '-r', '10000', '--site-rate', '10000', '--parsers', parsers]
+    return [python, 'pipeline.py', '--stages', 'biz,email,output', '-i', args.urls_file, '-o', output_path,
+            '--biz-workers', threads, '-r', '10000', '--site-rate', '10000', '--parsers', parsers]
+
+
+def row_number(line):
+    # business number of an output row: the yelp url of a csv row, or the website url of yelp_proc_req
+    match = BIZ_NUMBER.search(line.rstrip('\r').rstrip(',').split(',')[-1])
+    if match is None:
+        match = SITE_NUMBER.search(line)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+def requested_at(log_path, since):
+    # the first request of each business page in the log of the server
+    times = {}
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry['t'] < since:
+                continue
+            match = BIZ_NUMBER.search(entry['path'])
+            if match is not None:
+                times.setdefault(int(match.group(1)), entry['t'])
+    return times
+
+
+def run_script(case, args):
+    # run the script, note when each row shows up in its output
+    output_path = os.path.join(args.work, case + '.out')
+    with open(args.urls_file, 'r', encoding='utf-8') as f:
+        count = len([line for line in f if line.strip()])
+
+    started = time.time()
+    process = subprocess.Popen(script_command(case, args, output_path), cwd=YELP,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    seen = {}
+    offset = 0
+    rest = ''
+    rusage = None
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        done = pid != 0
+        if os.path.exists(output_path):
+            with open(output_path, 'r', encoding='utf-8', newline='') as f:
+                f.seek(offset)
+                text = f.read()
+                offset = f.tell()
+            lines = (rest + text).split('\n')
+            rest = lines.pop()
+            now = time.time()
+            for line in lines:
+                number = row_number(line)
+                if number is not None:
+                    seen.setdefault(number, now)
+        if done:
+            break
+        time.sleep(0.01)
+    process.returncode = status
+    seconds = time.time() - started
+    if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+        # e.g. yelp_proc.py without chrome to fall back to on the injected errors
+        raise RuntimeError("{} exited with status {}".format(case, status))
+
+    requested = requested_at(args.log, started)
+    latencies = [seen[number] - requested[number] for number in seen if number in requested]
+    return result(count, 'business', seconds, latencies, rusage.ru_maxrss)
+
+
+def run_case(case, args):
+    sys.path.insert(0, YELP)
+    sys.path.insert(1, YELP_SEARCH)
+    os.chdir(YELP)
+    if case in SCRIPTS:
+        return run_script(case, args)
+    return globals()['run_' + case](args)
+
+
+def start_server(args, log_path, urls_path):
+    command = [sys.executable, os.path.join(BENCH, 'corpus_server.py'), '-p', '0', '--latency', str(args.latency),
+               '--jitter', str(args.jitter), '--error-rate', str(args.error_rate), '--block-rate', str(args.block_rate),
+               '--seed', str(args.seed), '--log', log_path, '--urls', str(args.pages), '--urls-file', urls_path]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+    base = server.stdout.readline().strip()
+    if not base.startswith('http'):
+        server.kill()
+        print ("The corpus server did not start")
+        sys.exit(-1)
+    return server, base
+
+
+def rss_mb(kb):
+    # ru_maxrss is in bytes on macOS
+    if sys.platform == 'darwin':
+        return kb / 1024.0 / 1024.0
+    return kb / 1024.0
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Offline benchmarks on the page corpus and the local corpus server')
+    parser.add_argument('-c', '--cases', default=','.join(CASES), help='comma separated cases. default: all')
+    parser.add_argument('-n', '--pages', type=int, default=200, help='business pages, or pages of the other cases. default: 200')
+    parser.add_argument('-t', '--threads', type=int, default=4, help='worker threads of the cases and scripts. default: 4')
+    parser.add_argument('--concurrency', type=int, default=50, help='requests in flight of yelp_proc_req_async. default: 50')
+    parser.add_argument('--parsers', type=int, default=0, help='--parsers of the scripts and the cases. default: 0')
+    parser.add_argument('--latency', type=float, default=0.05, help='server latency in seconds. default: 0.05')
+    parser.add_argument('--jitter', type=float, default=0.5, help='the latency varies by this fraction. default: 0.5')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the urls answered with 503. default: 0')
+    parser.add_argument('--block-rate', type=float, default=0.0, help='fraction of the yelp urls answered with the block page. default: 0')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the server latency and errors. default: 1')
+    parser.add_argument('--json', help='write the results to this json file')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--base', help=argparse.SUPPRESS)
+    parser.add_argument('--log', help=argparse.SUPPRESS)
+    parser.add_argument('--urls-file', help=argparse.SUPPRESS)
+    parser.add_argument('--work', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # a case in a process of its own, the result is the last line
+        try:
+            print (json.dumps(run_case(args.run, args)))
+        except Exception as e:
+            print (json.dumps({"error": str(e)}))
+        sys.exit(0)
+
+    cases = [case.strip() for case in args.cases.split(',') if case.strip()]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        print ("Unknown cases:", ', '.join(unknown), "- cases are", ', '.join(CASES))
+        sys.exit(-1)
+
+    work = tempfile.mkdtemp(prefix='yelp-bench-')
+    log_path = os.path.join(work, 'requests.jsonl')
+    urls_path = os.path.join(work, 'urls.txt')
+    server, base = start_server(args, log_path, urls_path)
+
+    # the business websites are reached through the corpus server
+    env = dict(os.environ, HTTP_PROXY=base, http_proxy=base, NO_PROXY='', no_proxy='')
+    print ("{} pages, {} threads, {} parsers, latency {}s +-{:.0f}%, error rate {}, block rate {}".format(
+        args.pages, args.threads, args.parsers, args.latency, args.jitter * 100, args.error_rate, args.block_rate))
+    print ("{:26s} {:>7s} {:>9s} {:>9s} {:>9s} {:>12s}".format('case', 'pages', 'pages/s', 'p50 ms', 'p99 ms', 'peak RSS MB'))
+
+    results = []
+    try:
+        for case in cases:
+            command = [sys.executable, os.path.abspath(__file__), '--run', case, '--base', base, '--log', log_path,
+                       '--urls-file', urls_path, '--work', work, '-n', str(args.pages), '-t', str(args.threads),
+                       '--concurrency', str(args.concurrency), '--parsers', str(args.parsers)]
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, env=env, universal_newlines=True)
+            output = process.stdout.read()
+            pid, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = status
+            try:
+                line = json.loads(output.strip().split('\n')[-1])
+            except (ValueError, IndexError):
+                line = {"error": "no result"}
+            if 'error' in line:
+                print ("{:26s} failed: {}".format(case, line['error']))
+                continue
+
+            # a script reports its own peak, the case process only waits for it
+            rss_kb = line['rss_kb'] if line['rss_kb'] is not None else rusage.ru_maxrss
+            line.update({"case": case, "pages_per_second": round(line['items'] / line['seconds'], 1) if line['seconds'] else 0.0,
+                         "peak_rss_mb": round(rss_mb(rss_kb), 1)})
+            del line['rss_kb']
+            results.append(line)
+            print ("{:26s} {:7d} {:9.1f} {:9.2f} {:9.2f} {:12.1f}  latency per {}".format(
+                case, line['items'], line['pages_per_second'], line['p50'], line['p99'], line['peak_rss_mb'], line['per']))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work, ignore_errors=True)
+
+    if args.json:
+        settings = {key: getattr(args, key) for key in ('pages', 'threads', 'concurrency', 'parsers', 'latency',
+                                                         'jitter', 'error_rate', 'block_rate', 'seed')}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
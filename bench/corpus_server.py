@@ -0,0 +1,251 @@
+"""
+Local stand-in for yelp.com and the business websites, serving the page corpus
+(make_corpus.py) with an injected latency, error rate and block page rate.
+
+yelp pages are served on the server address(or any request with Host: www.yelp.com):
+    /biz/<slug>          business page of corpus/biz/<slug>.html
+    /biz/<slug>-<n>      the same page, its website is business website n
+    /search?start=<k>    search page k / 10 of corpus/search
+Business website n is http://www.biz-site-<n>.test/, one of corpus/sites by n.
+The .test hosts are reached through the server as an http proxy(HTTP_PROXY=<server address>),
+so every business website is a domain of its own for the email crawler.
+
+Latency and errors are picked from a hash of the url and the seed, so a url gets the
+same latency and the same error in every run.
+
+Command : python corpus_server.py -p 8800 --latency 0.05 --jitter 0.5 --error-rate 0.02 --block-rate 0.01 --log requests.jsonl
+"""
+import argparse
+import glob
+import json
+import os
+import posixpath
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import quote, urlsplit, parse_qs
+
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+SITE_HOST = re.compile(r'^www\.biz-site-(\d+)\.test$')
+BIZ_PATH = re.compile(r'^/biz/([^/]+?)(?:-(\d+))?$')
+YELP_HOSTS = ('www.yelp.com', 'yelp.com', 'localhost', '127.0.0.1')
+
+
+def site_url(n):
+    return 'http://www.biz-site-{}.test/'.format(n)
+
+
+class Corpus(object):
+    # the pages of the corpus directory, read once
+
+    def __init__(self, path):
+        self.biz = {}
+        for page in sorted(glob.glob(os.path.join(path, 'biz', '*.html'))):
+            with open(page, 'r', encoding='utf-8') as f:
+                self.biz[os.path.basename(page)[:-len('.html')]] = f.read()
+        self.slugs = sorted(self.biz)
+
+        self.search = []
+        for page in sorted(glob.glob(os.path.join(path, 'search', '*.html'))):
+            with open(page, 'rb') as f:
+                self.search.append(f.read())
+
+        self.sites = []
+        for site in sorted(glob.glob(os.path.join(path, 'sites', '*'))):
+            pages = {}
+            for page in glob.glob(os.path.join(site, '**', '*.html'), recursive=True):
+                with open(page, 'rb') as f:
+                    pages['/' + os.path.relpath(page, site).replace(os.sep, '/')] = f.read()
+            self.sites.append(pages)
+
+        with open(os.path.join(path, 'block.html'), 'rb') as f:
+            self.block = f.read()
+
+    def biz_page(self, slug, n):
+        # the business page, its website link pointing at business website n
+        page = self.biz.get(slug)
+        if page is None:
+            return None
+        if n is None:
+            n = self.slugs.index(slug)
+        return page.replace('{{WEBSITE}}', quote(site_url(n), safe='')).encode('utf-8')
+
+    def site_page(self, n, path):
+        pages = self.sites[n % len(self.sites)]
+        path = posixpath.normpath('/' + path.lstrip('/'))
+        if path == '/' or path.endswith('/'):
+            path = path.rstrip('/') + '/index.html'
+        if path not in pages and path + '/index.html' in pages:
+            path = path + '/index.html'
+        return pages.get(path)
+
+
+class Faults(object):
+    """
+    Latency and errors of a request, picked from a hash of the url and the seed.
+    error_rate of the requests get 503, block_rate of the yelp pages the block page.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, block_rate=0.0, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.block_rate = block_rate
+        self.seed = seed
+
+    def draw(self, url, salt):
+        # a number in [0, 1) for the url
+        return zlib.crc32('{}:{}:{}'.format(self.seed, salt, url).encode('utf-8')) / 4294967296.0
+
+    def delay(self, url):
+        return max(0.0, self.latency * (1 + self.jitter * (2 * self.draw(url, 'latency') - 1)))
+
+    def error(self, url):
+        return self.draw(url, 'error') < self.error_rate
+
+    def blocked(self, url):
+        return self.draw(url, 'block') < self.block_rate
+
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written apart, nagle would hold the body for the delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        start = time.time()
+        server = self.server
+
+        # an http proxy gets the full url
+        if self.path.startswith('http://') or self.path.startswith('https://'):
+            parts = urlsplit(self.path)
+            host = (parts.hostname or '').lower()
+        else:
+            parts = urlsplit('http://server' + self.path)
+            host = (self.headers.get('Host') or '').split(':')[0].lower()
+
+        # the faults of a yelp page do not depend on how it was reached
+        url = '{}{}'.format('yelp' if host in YELP_HOSTS else host, parts.path)
+        if parts.query:
+            url += '?' + parts.query
+
+        time.sleep(server.faults.delay(url))
+        status, body = self.route(host, parts.path, parts.query, url)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        server.record(start, host, parts.path, status)
+
+    def route(self, host, path, query, url):
+        server = self.server
+        corpus = server.corpus
+
+        match = SITE_HOST.match(host)
+        if match is not None:
+            if server.faults.error(url):
+                return 503, b'Service Unavailable'
+            page = corpus.site_page(int(match.group(1)), path)
+            if page is None:
+                return 404, b'Not Found'
+            return 200, page
+
+        if host not in YELP_HOSTS:
+            return 404, b'Not Found'
+        if server.faults.error(url):
+            return 503, b'Service Unavailable'
+        if server.faults.blocked(url):
+            return 200, corpus.block
+
+        match = BIZ_PATH.match(path)
+        if match is not None:
+            n = match.group(2)
+            page = corpus.biz_page(match.group(1), int(n) if n is not None else None)
+            if page is None and n is not None:
+                # a slug ending with a number
+                page = corpus.biz_page('{}-{}'.format(match.group(1), n), None)
+            if page is None:
+                return 404, b'Not Found'
+            return 200, page
+
+        if path == '/search':
+            start = int(parse_qs(query).get('start', ['0'])[0])
+            return 200, corpus.search[(start // 10) % len(corpus.search)]
+        return 404, b'Not Found'
+
+
+class CorpusServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # many workers connect at once
+    request_queue_size = 256
+
+    def __init__(self, address, corpus, faults, log_path=None):
+        HTTPServer.__init__(self, address, CorpusHandler)
+        self.corpus = corpus
+        self.faults = faults
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.log = None
+        if log_path:
+            self.log = open(log_path, 'a', encoding='utf-8')
+
+    def record(self, start, host, path, status):
+        with self.lock:
+            self.requests += 1
+            if self.log is not None:
+                self.log.write(json.dumps({"t": round(start, 4), "host": host, "path": path, "status": status,
+                                           "seconds": round(time.time() - start, 4)}) + '\n')
+                self.log.flush()
+
+
+def biz_urls(corpus, base, count):
+    # count business urls, each with a website of its own
+    return ['{}/biz/{}-{}'.format(base, corpus.slugs[i % len(corpus.slugs)], i) for i in range(count)]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Serve the page corpus as yelp.com and the business websites')
+    parser.add_argument('-p', '--port', type=int, default=8800, help='port, 0 picks a free one. default: 8800')
+    parser.add_argument('-c', '--corpus', default=CORPUS, help='corpus directory. default: corpus')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each response. default: 0')
+    parser.add_argument('--jitter', type=float, default=0.0, help='latency varies by this fraction up and down. default: 0')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the urls answered with 503. default: 0')
+    parser.add_argument('--block-rate', type=float, default=0.0, help='fraction of the yelp urls answered with the block page. default: 0')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the latency and error picks. default: 1')
+    parser.add_argument('--log', help='json lines file of the served requests')
+    parser.add_argument('--urls', type=int, default=0, help='write this many business urls to --urls-file')
+    parser.add_argument('--urls-file', default='urls.txt', help='file of the business urls. default: urls.txt')
+    args = parser.parse_args()
+
+    corpus = Corpus(args.corpus)
+    if len(corpus.biz) == 0 or len(corpus.sites) == 0 or len(corpus.search) == 0:
+        print ("The corpus needs biz, search and sites pages, run make_corpus.py")
+        sys.exit(-1)
+
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.block_rate, args.seed)
+    server = CorpusServer(('127.0.0.1', args.port), corpus, faults, args.log)
+    base = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    if args.urls > 0:
+        with open(args.urls_file, 'w', encoding='utf-8') as f:
+            f.write(''.join(url + '\n' for url in biz_urls(corpus, base, args.urls)))
+
+    # the first line is read by bench_suite.py
+    print (base)
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,204 @@
+"""
+Writes the page corpus of corpus_server.py: yelp search pages, business pages and
+small business websites, in the markup the scrapers parse.
+The pages are generated from a seed, so the same command gives the same corpus.
+Saved pages can be added next to them, see readme.md for the placeholders.
+
+Command : python make_corpus.py -o corpus -b 24 -s 8
+"""
+import argparse
+import json
+import os
+import random
+
+
+CITIES = [('San Francisco', 'CA', '94103'), ('Austin', 'TX', '78701'), ('Denver', 'CO', '80202'),
+          ('Portland', 'OR', '97205'), ('Chicago', 'IL', '60607'), ('Boston', 'MA', '02116')]
+CATEGORIES = [('plumbing', 'Plumbing'), ('electricians', 'Electricians'), ('bakeries', 'Bakeries'),
+              ('autorepair', 'Auto Repair'), ('dentists', 'General Dentistry'), ('florists', 'Florists'),
+              ('hvac', 'Heating & Air Conditioning/HVAC'), ('locksmiths', 'Keys & Locksmiths')]
+WORDS = ('great service friendly staff quick fair price came out same day fixed the problem would recommend '
+         'called them twice booked online arrived late but explained everything clean work good value '
+         'the owner was helpful will use again not cheap but worth it parking is hard to find').split()
+NAMES = ['Golden Gate', 'Bright Star', 'Main Street', 'Blue Ridge', 'Red Door', 'Oak Tree', 'Sunrise', 'Liberty',
+         'Harbor', 'Summit', 'Pioneer', 'Evergreen', 'Union', 'Cornerstone', 'Riverside', 'Maple']
+KINDS = ['Plumbing', 'Electric', 'Bakery', 'Auto Care', 'Dental', 'Flowers', 'Heating & Air', 'Lock & Key']
+STAFF = ['james', 'mary', 'robert', 'linda', 'michael', 'susan', 'david', 'karen', 'maria', 'chris']
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for i in range(words)).capitalize() + '.'
+
+
+def make_business(rng, index):
+    kind = index % len(KINDS)
+    name = '{} {}'.format(NAMES[index % len(NAMES)], KINDS[kind])
+    city, region, postal = CITIES[index % len(CITIES)]
+    slug = '{}-{}'.format(name, city).lower().replace('&', 'and').replace(' ', '-')
+    return {
+        'slug': slug,
+        'name': name,
+        'category': CATEGORIES[kind],
+        'city': city,
+        'region': region,
+        'postal': postal,
+        'street': '{} {} St'.format(rng.randint(10, 2999), rng.choice(['Market', 'Mission', 'Pine', 'Elm', 'Lake'])),
+        'phone': '({}) {}-{:04d}'.format(rng.randint(200, 989), rng.randint(200, 989), rng.randint(0, 9999)),
+        'rating': rng.choice([1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]),
+        'reviews': rng.randint(3, 900),
+        'price': rng.choice(['$', '$$', '$$$']),
+        'claimed': rng.random() < 0.6,
+        # about one business in six lists no website
+        'website': index % 6 != 5,
+    }
+
+
+def biz_page(rng, business):
+    ld_business = {
+        "@context": "http://schema.org/", "@type": "LocalBusiness", "name": business['name'],
+        "telephone": business['phone'], "priceRange": business['price'],
+        "address": {"streetAddress": business['street'], "addressLocality": business['city'],
+                    "addressRegion": business['region'], "postalCode": business['postal']},
+        "aggregateRating": {"@type": "AggregateRating", "ratingValue": business['rating'],
+                            "reviewCount": business['reviews']},
+        "review": [{"author": rng.choice(STAFF).capitalize(), "reviewRating": {"ratingValue": rng.randint(1, 5)},
+                    "description": sentence(rng, 30)} for i in range(5)]
+    }
+    ld_breadcrumb = {"@context": "http://schema.org/", "@type": "BreadcrumbList", "itemListElement": [
+        {"@type": "ListItem", "position": 1, "item": {"@id": "https://www.yelp.com/c/{}".format(business['category'][0]),
+                                                       "name": business['category'][1]}}]}
+
+    parts = []
+    parts.append('<!DOCTYPE html>\n<html lang="en"><head><meta charset="utf-8">')
+    parts.append('<title>{} - {} - Yelp</title>'.format(business['name'], business['city']))
+    parts.append('<meta name="description" content="{} reviews of {}.">'.format(business['reviews'], business['name']))
+    parts.append('<meta property="og:title" content="{}">'.format(business['name']))
+    parts.append('<link rel="stylesheet" href="https://s3-media0.fl.yelpcdn.com/assets/yelp_main.css">')
+    parts.append('<script src="https://s3-media0.fl.yelpcdn.com/assets/yelp_main.js"></script>')
+    parts.append('<script type="application/ld+json">{}</script>'.format(json.dumps(ld_breadcrumb)))
+    parts.append('<script type="application/ld+json">{}</script>'.format(json.dumps(ld_business)))
+    parts.append('</head><body class="biz-details">')
+    parts.append('<div class="main-header"><a href="/">Yelp</a><form action="/search"><input name="find_desc"></form></div>')
+    parts.append('<div class="main-content-wrap main-content-wrap--full"><div class="top-shelf">')
+    parts.append('<div class="hidden"><meta itemprop="name" content="{}"><meta itemprop="priceRange" content="{}"></div>'.format(
+        business['name'], business['price']))
+    parts.append('<h1 class="biz-page-title embossed-text-white">{}</h1>'.format(business['name']))
+    if business['claimed']:
+        parts.append('<span class="claim-status_icon u-space-r1 claim-status_icon--claimed i-checkmark-badged"></span>')
+    parts.append('<div class="biz-rating"><div class="i-stars" title="{} star rating"></div>'.format(business['rating']))
+    parts.append('<span class="review-count rating-qualifier"><span itemprop="reviewCount">{}</span> reviews</span></div>'.format(
+        business['reviews']))
+    parts.append('<span class="category-str-list"><a href="/c/{}/{}">{}</a></span>'.format(
+        business['city'].lower().replace(' ', '-'), business['category'][0], business['category'][1]))
+    parts.append('</div><div class="mapbox-text"><address>')
+    for prop in ('street', 'city', 'region', 'postal'):
+        itemprop = {'street': 'streetAddress', 'city': 'addressLocality', 'region': 'addressRegion', 'postal': 'postalCode'}[prop]
+        parts.append('<span itemprop="{}">{}</span> '.format(itemprop, business[prop]))
+    parts.append('</address><span class="biz-phone" itemprop="telephone">{}</span>'.format(business['phone']))
+    if business['website']:
+        # {{WEBSITE}} is replaced by the server with the quoted url of a website of the corpus
+        parts.append('<span class="biz-website js-biz-website"><a href="/biz_redir?url={{{{WEBSITE}}}}&amp;website_link_type=website'
+                     '&amp;src_bizid={}" target="_blank" rel="noopener nofollow">{}.com</a></span>'.format(
+                         business['slug'][:22], business['slug'].split('-')[0]))
+    parts.append('</div></div><div class="review-list"><ul class="ylist">')
+    for i in range(40):
+        parts.append('<li><div class="review review--with-sidebar"><div class="review-sidebar"><a class="user-display-name" '
+                     'href="/user_details?userid=u{}">{}</a></div><div class="review-content"><div class="i-stars" '
+                     'title="{}.0 star rating"></div><span class="rating-qualifier">{}/{}/2019</span><p lang="en">{}</p>'
+                     '</div></div></li>'.format(rng.randint(1000, 99999), rng.choice(STAFF).capitalize(), rng.randint(1, 5),
+                                               rng.randint(1, 12), rng.randint(1, 28), sentence(rng, rng.randint(20, 80))))
+    parts.append('</ul></div></div><script>window.yelp = window.yelp || {};</script></body></html>\n')
+    return ''.join(parts)
+
+
+def search_page(rng, businesses, page, pages):
+    parts = []
+    parts.append('<!DOCTYPE html>\n<html lang="en"><head><meta charset="utf-8">')
+    parts.append('<meta name="viewport" content="width=device-width"><title>Top 10 Best near you - Yelp</title>')
+    parts.append('<script src="https://s3-media0.fl.yelpcdn.com/assets/yelp_main.js"></script>')
+    parts.append('<script src="https://s3-media0.fl.yelpcdn.com/assets/search_app.js"></script>')
+    parts.append('</head><body><div class="main-content-wrap"><ul class="lemon--ul__373c0__1_cxs undefined list__373c0__2G8oH">')
+    for business in businesses:
+        parts.append('<li class="lemon--li__373c0__1r9wz border-color--default__373c0__2oFDT"><div class="container__373c0__3HMKB">'
+                     '<h3><a class="lemon--a__373c0__IEZFH link__373c0__29943" href="/biz/{}?osq=Plumbers">{}</a></h3>'
+                     '<div class="i-stars__373c0__30xVZ" aria-label="{} star rating"></div><p>{}</p></div></li>'.format(
+                         business['slug'], business['name'], business['rating'], sentence(rng, 25)))
+    # list items without a business link, as the ads and the pagination are
+    parts.append('<li class="lemon--li__373c0__1r9wz"><a href="/adredir?ad_business_id=x">Ad</a></li>')
+    parts.append('<li class="lemon--li__373c0__1r9wz"><span>Page {} of {}</span></li>'.format(page + 1, pages))
+    parts.append('</ul>')
+    if page < pages - 1:
+        parts.append('<a class="lemon--a__373c0__IEZFH next-link navigation-button__373c0__1D3fo" '
+                     'href="/search?start={}">Next</a>'.format((page + 1) * 10))
+    parts.append('</div></body></html>\n')
+    return ''.join(parts)
+
+
+def site_pages(rng, index):
+    # a small business website, emails on some of its pages
+    name = '{} {}'.format(NAMES[(index * 5) % len(NAMES)], KINDS[index % len(KINDS)])
+    domain = name.lower().replace('&', 'and').replace(' ', '') + '.com'
+    nav = ('<nav><a href="/">Home</a> <a href="/about.html">About</a> <a href="services.html">Services</a> '
+           '<a href="/team/index.html">Team</a> <a href="/contact.html">Contact</a> <a href="#top">Top</a> '
+           '<a href="https://www.facebook.com/{0}">Facebook</a> <a href="https://www.yelp.com/biz/{0}">Yelp</a></nav>').format(
+               domain.split('.')[0])
+
+    def page(title, body):
+        return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{} | {}</title>'
+                '<link rel="stylesheet" href="/css/site.css"></head><body>{}<main>{}</main>'
+                '<footer>&copy; 2019 {}</footer></body></html>\n').format(title, name, nav, body, name)
+
+    emails = index % 8 != 7
+    text = ''.join('<p>{}</p>'.format(sentence(rng, rng.randint(30, 90))) for i in range(6))
+    pages = {
+        'index.html': page('Home', '<h1>{}</h1>{}'.format(name, text)),
+        'about.html': page('About', '<h1>About us</h1>' + text),
+        'services.html': page('Services', '<ul>' + ''.join('<li>{}</li>'.format(sentence(rng, 6)) for i in range(12)) + '</ul>'),
+    }
+    if emails:
+        pages['contact.html'] = page('Contact', '<h1>Contact</h1><p>Write to <a href="mailto:info@{0}">info@{0}</a> '
+                                                'or call us.</p><p>Billing: billing@{0}</p><p>Webmaster: webmaster@{0}</p>'.format(domain))
+        staff = ''.join('<li>{0} - <a href="mailto:{0}@{1}">{0}@{1}</a></li>'.format(rng.choice(STAFF) + str(i), domain)
+                        for i in range(index % 4 * 5))
+        pages['team/index.html'] = page('Team', '<h1>Our team</h1><ul>{}</ul>'.format(staff))
+    else:
+        pages['contact.html'] = page('Contact', '<h1>Contact</h1><form action="/send"><textarea></textarea></form>')
+        pages['team/index.html'] = page('Team', '<h1>Our team</h1>' + text)
+    return pages
+
+
+def write(path, text):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Write the page corpus of the offline benchmarks')
+    parser.add_argument('-o', '--output', default='corpus', help='corpus directory. default: corpus')
+    parser.add_argument('-b', '--businesses', type=int, default=24, help='business pages. default: 24')
+    parser.add_argument('-s', '--sites', type=int, default=8, help='business websites. default: 8')
+    parser.add_argument('--seed', type=int, default=1, help='random seed. default: 1')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    businesses = [make_business(rng, i) for i in range(args.businesses)]
+    for business in businesses:
+        write(os.path.join(args.output, 'biz', business['slug'] + '.html'), biz_page(rng, business))
+
+    pages = (len(businesses) + 9) // 10
+    for page in range(pages):
+        write(os.path.join(args.output, 'search', 'page{}.html'.format(page + 1)),
+              search_page(rng, businesses[page * 10:(page + 1) * 10], page, pages))
+
+    for index in range(args.sites):
+        for path, text in site_pages(rng, index).items():
+            write(os.path.join(args.output, 'sites', 'site{}'.format(index + 1), path), text)
+
+    write(os.path.join(args.output, 'block.html'),
+          '<html><head><script src="/error-pages/block.js"></script></head><body>'
+          '<p>Sorry, you\'re not allowed to access this page.</p></body></html>\n')
+    print ("{} business pages, {} search pages and {} websites in {}".format(len(businesses), pages, args.sites, args.output))
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import sys
+import threading
+from array import array
+from urllib.parse import urlsplit
+
+# the table grows when it is fuller than this
+MAX_LOAD = 0.7
+
+
+def normalize_link(link):
+    # the same business with another query string or a trailing slash is the same link
+    parts = urlsplit(link.strip())
+    path = parts.path.rstrip('/')
+    return "{}://{}{}".format(parts.scheme.lower(), parts.netloc.lower(), path)
+
+
+def fingerprint(link):
+    # 64-bit hash of the normalized link, 0 marks an empty slot of the table
+    digest = hashlib.blake2b(normalize_link(link).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class FingerprintSet(object):
+    """
+    Set of links seen across all searches, kept as 64-bit fingerprints in an
+    open addressing table, 8 bytes a slot instead of a python string per link.
+    The table doubles when it is 0.7 full, so it is 0.35 to 0.7 full and a link
+    costs about 11 to 23 bytes, plus the old table for the time it grows.
+    With a path, new fingerprints are appended to the file and loaded by the next run.
+    """
+
+    def __init__(self, path=None, capacity=1 << 16):
+        self.lock = threading.Lock()
+        self.table = array('Q', [0]) * capacity
+        self.mask = capacity - 1
+        self.count = 0
+        self.path = path
+        self.file = None
+
+        if path is not None:
+            if os.path.exists(path):
+                self.load()
+            self.file = open(path, 'ab')
+
+    def load(self):
+        # the file is a list of fingerprints, an interrupted write leaves a partial one
+        size = os.path.getsize(self.path)
+        size -= size % 8
+        saved = array('Q')
+        with open(self.path, 'rb') as f:
+            saved.fromfile(f, size // 8)
+        if sys.byteorder != 'little':
+            saved.byteswap()
+        if size != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(size)
+
+        while (self.count + len(saved)) > (self.mask + 1) * MAX_LOAD:
+            self.grow()
+        for fp in saved:
+            self.insert(fp)
+
+    def grow(self):
+        old = self.table
+        self.table = array('Q', [0]) * (len(old) * 2)
+        self.mask = len(self.table) - 1
+        self.count = 0
+        for fp in old:
+            if fp:
+                self.insert(fp)
+
+    def insert(self, fp):
+        # True when the fingerprint was not in the table yet
+        table = self.table
+        mask = self.mask
+        index = fp & mask
+        while True:
+            slot = table[index]
+            if slot == 0:
+                table[index] = fp
+                self.count += 1
+                return True
+            if slot == fp:
+                return False
+            index = (index + 1) & mask
+
+    def add(self, link):
+        """
+        Add the link, True when it was not seen before.
+        """
+        fp = fingerprint(link)
+        with self.lock:
+            if self.count + 1 > (self.mask + 1) * MAX_LOAD:
+                self.grow()
+            if not self.insert(fp):
+                return False
+            if self.file is not None:
+                self.file.write(fp.to_bytes(8, 'little'))
+            return True
+
+    def __contains__(self, link):
+        fp = fingerprint(link)
+        with self.lock:
+            index = fp & self.mask
+            while True:
+                slot = self.table[index]
+                if slot == 0:
+                    return False
+                if slot == fp:
+                    return True
+                index = (index + 1) & self.mask
+
+    def __len__(self):
+        return self.count
+
+    def flush(self):
+        # write the new fingerprints, after the links they stand for are in the output
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -4,9 +4,25 @@ import sys
 import argparse
 from argparse import RawTextHelpFormatter
 import time, signal
+import threading
+from multiprocessing.pool import ThreadPool
 from bs4 import BeautifulSoup
 import random
 from urllib.parse import quote, unquote
+import os
+
+# the rate limiter, scheduler, browser pool and the other shared modules are the ones of the yelp folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'yelp'))
+
+from rate_limiter import RateLimiter
+from checkpoint import ProgressJournal
+from browser_pool import BrowserPool
+from lean_browser import lean_options, block_urls, LEAN_CAPABILITIES
+from functools import partial
+from scheduler import JobQueue
+from link_filter import FingerprintSet
+from parse_pool import ParsePool
+import metrics
 
 
    
@@ -15,6 +31,9 @@ class ProgramKilled(Exception):
 class InvalidFileError(Exception):
     pass
 
+# searches of parallel workers write to the same output file
+output_lock = threading.Lock()
+
 def signal_handler(signum, frame):
     raise ProgramKilled    
 
@@ -44,19 +63,28 @@ def get_substring(instr, startstr, endstr=None):
         return instr[start_idx:]
     
     
-def get_driver(debug):
-    # option setting headless
+def get_driver(debug, lean=False):
+    # launch a new browser, the browser pool keeps and reuses it
+    # lean: no images, fonts, css and trackers, eager page loads
     
     options = webdriver.ChromeOptions()
     options.add_experimental_option("excludeSwitches",["ignore-certificate-errors"])
     options.add_argument('--disable-gpu')
     options.add_argument('--headless')
+
+    capabilities = None
+    if lean:
+        lean_options(options)
+        capabilities = dict(LEAN_CAPABILITIES)
+
     if debug:
         driver = webdriver.Chrome()
     else:
         # driver = webdriver.Chrome("chromedriver.exe", chrome_options=options)
-        driver = webdriver.Chrome(chrome_options=options)
+        driver = webdriver.Chrome(chrome_options=options, desired_capabilities=capabilities)
 
+    if lean:
+        block_urls(driver)
     return driver
     
 
@@ -84,7 +112,20 @@ Samples:
     parser.add_argument('-p', '--pages', type=int, help='page count. default: 10', default=10)    
     parser.add_argument('-ta', '--throttlea', type=str, help='throttle time range in seconds. default: 5-10', default="5-10")
     parser.add_argument('-tb', '--throttleb', type=str, help='throttle time range in seconds. default: 2-5', default="2-5")
+    parser.add_argument('-r', '--rate', type=float, help='page requests per second to yelp.com. default: 2 / (sum of -ta range)')
+    parser.add_argument('--adaptive', action='store_true', help='raise the rate while pages come back fine, cut it and wait less than -b on bans and timeouts')
+    parser.add_argument('--min-rate', type=float, help='lowest rate of --adaptive. default: rate / 10')
+    parser.add_argument('--max-rate', type=float, help='highest rate of --adaptive. default: rate * 4')
     parser.add_argument('-b', '--banned', type=int, help='waiting time in seconds when banned. default: 900', default=900)
+    parser.add_argument('--recycle-pages', type=int, help='pages the browser loads before it is restarted. default: 100', default=100)
+    parser.add_argument('--recycle-memory', type=int, help='restart the browser when it uses more MB than this, needs psutil. default: 0(off)', default=0)
+    parser.add_argument('--lean', action='store_true', help='the browser skips images, fonts, css and trackers and returns at DOMContentLoaded')
+    parser.add_argument('-w', '--workers', type=int, help='searches crawled in parallel, each in its own browser. default: 1', default=1)
+    parser.add_argument('--seen', type=str, help='file of the links found so far, kept across runs; links in it are not written again')
+    parser.add_argument('--parsers', type=int, help='processes parsing the search pages, 0 parses in the workers. default: 0', default=0)
+    parser.add_argument('-j', '--journal', type=str, help='progress journal; a rerun with the same file skips the finished searches and pages')
+    parser.add_argument('--stats', type=int, help='seconds between the stats lines, 0 for none. default: 60', default=60)
+    parser.add_argument('--metrics-port', type=int, help='serve the metrics as prometheus text on 127.0.0.1:<port>/metrics')
     parser.add_argument('-v', '--verbose', action='store_true', help='verbose mode')
     parser.add_argument('-d', '--debug', action='store_true', help='debug mode')
     
@@ -119,9 +160,32 @@ Samples:
             if min > 0 and max > 0 and min < max:
                 tb = [min, max]            
 
+    rate = 2.0 / (ta[0] + ta[1])
+    if args.rate and args.rate > 0:
+        rate = args.rate
+
+    adaptive = None
+    if args.adaptive:
+        adaptive = (args.min_rate or rate / 10.0, args.max_rate or rate * 4)
+
+    journal = args.journal
+    recycle = [args.recycle_pages, args.recycle_memory]
+    lean = args.lean
+    seen = args.seen
+
+    workers = 1
+    if args.workers and args.workers > 1:
+        workers = args.workers
+
+    parsers = 0
+    if args.parsers and args.parsers > 0:
+        parsers = args.parsers
+
     banned = 900
     if args.banned:
         banned = args.banned
+
+    stats = [args.stats, args.metrics_port]
             
     verbose = False
     if args.verbose:
@@ -132,9 +196,9 @@ Samples:
         debug = True
 
     if verbose:
-        print ("Parameter :", search, loc, output, ta, tb, banned, verbose, debug)
+        print ("Parameter :", search, loc, output, ta, tb, rate, adaptive, journal, seen, recycle, lean, workers, parsers, banned, stats, verbose, debug)
 
-    return  search, loc, output, pages, ta, tb, banned, verbose, debug
+    return  search, loc, output, pages, rate, adaptive, tb, journal, seen, recycle, lean, workers, parsers, banned, stats, verbose, debug
 
 
 def ready_categories_cities(search, loc):
@@ -225,43 +289,85 @@ def check_has_nextpage(soup):
         return False
     
 
-def crawl_yelp(driver, category, city, pages, ta, output_file, verbose):
+def parse_search_page(page_source):
+    # banned, business links and next page of a search page, run on the parse pool
+    soup = BeautifulSoup(page_source, 'lxml')
+    if check_banned(soup) == True:
+        return True, [], False
+    return False, get_business_links(soup), check_has_nextpage(soup)
+
+
+def crawl_yelp(browsers, category, city, pages, limiter, output_file, verbose, journal=None, seen=None, parsers=None):
     if verbose:
         msg = "--- Search category: {}, city: {}".format(category, city)
         print (msg)
 
+    if parsers is None:
+        parsers = ParsePool()
+
     try:
 
-        biz_links = []
+        biz_links = set()
         links_per_page = 10
         links_fetched = False
+
+        # pages of this search finished by an earlier run
+        if journal is not None:
+            first_page = journal.get((city, category, 0))
+            if first_page is not None:
+                links_per_page = first_page['links_per_page']
+                links_fetched = True
+
         for page in range(pages):    
+            if journal is not None and journal.is_done((city, category, page)):
+                continue
+
             search_url = make_yelp_search_url(category, city, page, links_per_page)
 
             if verbose:
                 msg = "------ Crawling page: {}".format(page+1)
                 print (msg)
                         
-            driver.get(search_url)
-            soup = BeautifulSoup(driver.page_source, 'lxml')
+            with browsers.lease() as browser:
+                limiter.acquire(search_url)
+                start = time.time()
+                browser.driver.get(search_url)
+                page_source = browser.driver.page_source
+                metrics.histogram('fetch_seconds', page='search').observe(time.time() - start)
+                metrics.counter('pages_fetched_total', page='search').inc()
+
+                start = time.time()
+                banned, links, has_nextpage = parsers.run(parse_search_page, page_source)
+                metrics.histogram('parse_seconds', page='search').observe(time.time() - start)
+
+                # Check if the Yelp allows browsing
+                if banned == True:
+                    # the search starts over in a fresh browser after the wait
+                    limiter.feedback(search_url, blocked=True)
+                    browser.retire()
+                    return False
+                limiter.feedback(search_url)
             
-            # Check if the Yelp allows browsing
-            if check_banned(soup) == True:
-                return False
-            
-            links = get_business_links(soup)
             if len(links) == 0:
                 break
-            for link in links:
-                biz_links.append(link)
+
+            # write the new links of the page right away, so a restart loses at most one page.
+            # links already found by another search are left out
+            with output_lock:
+                for link in links:
+                    if link not in biz_links:
+                        biz_links.add(link)
+                        if seen is None or seen.add(link):
+                            output_file.write(link)
+                            output_file.write('\n')
+                            metrics.counter('links_found_total').inc()
+                output_file.flush()
+                if seen is not None:
+                    seen.flush()
             if verbose:
                 msg = "------ Crawled {} business links".format(len(biz_links))
                 print (msg)
 
-            # Check if the next page is exist
-            if check_has_nextpage(soup) == False:
-                break
-
             # Determine links count per page
             if links_fetched == False:
                 links_per_page = len(biz_links)
@@ -270,29 +376,58 @@ def crawl_yelp(driver, category, city, pages, ta, output_file, verbose):
                 else:
                     links_per_page = 10
                 links_fetched = True
-                
-            # throttling between pages
-            wait_for(ta[0], ta[1])
 
-        # remove duplicate items
-        biz_links = list(set(biz_links))
-        for link in biz_links:
-            output_file.write(link)
-            output_file.write('\n')
+            if journal is not None:
+                journal.mark_done((city, category, page), links_per_page=links_per_page)
 
-        output_file.flush()
+            # Check if the next page is exist
+            if has_nextpage == False:
+                break
         
         return True
     except TimeoutException:
         print ("Network Error occurred.")
+        metrics.counter('pages_failed_total', page='search').inc()
+        limiter.feedback(search_url, timed_out=True)
         return False
     except ProgramKilled:
         print ("Exit script...")
-        driver.quit()
+        browsers.shutdown()
         sys.exit(0)
     except:
         print ("Unknown Error occurred.")
         return False
+
+
+def search_worker(params):
+    # crawl the searches of the queue, waiting out bans as the single worker does
+
+    searches = params['searches']
+    browsers = params['browsers']
+    limiter = params['limiter']
+    output_file = params['output']
+    journal = params['journal']
+    seen = params.get('seen')
+    parsers = params.get('parsers')
+    pages = params['pages']
+    tb = params['tb']
+    banned = params['banned']
+    verbose = params['verbose']
+
+    for city, category in searches:
+        while True:
+            crawled = crawl_yelp(browsers, category, city, pages, limiter, output_file, verbose, journal, seen, parsers)
+            if crawled == True:
+                if journal is not None:
+                    journal.mark_done((city, category))
+                wait_for(tb[0], tb[1])
+                break
+            else:
+                # the adaptive rate waits less, longer with each ban in a row
+                wait = limiter.ban_wait(banned)
+                msg = "The Yelp is banned, wait for {} seconds...".format(wait)
+                print (msg)
+                wait_for(wait, wait+10)
     
 
 if __name__ == "__main__":
@@ -303,7 +438,7 @@ if __name__ == "__main__":
     
     try:
         # Parse arguments
-        search, loc, output, pages, ta, tb, banned, verbose, debug = parse_argument()
+        search, loc, output, pages, rate, adaptive, tb, journal_file, seen_file, recycle, lean, workers, parser_count, banned, stats, verbose, debug = parse_argument()
         
         # Read categories and cities from the input files.
         categories, cities = ready_categories_cities(search, loc)
@@ -311,23 +446,87 @@ if __name__ == "__main__":
             print ("Category count  =", len(categories))
             print ("City count      =", len(cities))
 
-        driver = get_driver(debug)
-        with open(output, "w", encoding='utf-8') as output_file:
+        # the parser processes are started before the browsers
+        parsers = ParsePool(parser_count)
+        parsers.start()
+
+        # page requests to yelp.com are paced by one token bucket
+        limiter = RateLimiter(rate, rate, adaptive=adaptive)
+
+        journal = None
+        output_mode = "w"
+        if journal_file:
+            journal = ProgressJournal(journal_file)
+            if journal.resuming():
+                # append to the output of the interrupted run
+                output_mode = "a"
+                print ("Resuming from the journal :", journal_file)
+
+        # links of all searches, so a business is written once
+        seen = FingerprintSet(seen_file)
+        if verbose and len(seen) > 0:
+            print ("Links seen before :", len(seen))
+
+        # a browser per worker, all workers share the rate limiter
+        browsers = BrowserPool(partial(get_driver, debug, lean), workers, recycle[0], recycle[1], verbose)
+        browsers.start()
+        with open(output, output_mode, encoding='utf-8') as output_file:
             if verbose:
                 print ("Main Processing...")
 
+            searches = []
             for city in cities:
                 for category in categories:
-                    while True:
-                        crawled = crawl_yelp(driver, category, city, pages, ta, output_file, verbose)
-                        if crawled == True:
-                            wait_for(tb[0], tb[1])
-                            break
-                        else:
-                            msg = "The Yelp is banned, wait for {} seconds...".format(banned)
-                            print (msg)
-                            driver.quit()
-                            driver = get_driver()
-                            wait_for(banned, banned+10)
+                    if journal is not None and journal.is_done((city, category)):
+                        continue
+                    searches.append((city, category))
+
+            # the workers pull the next search from the queue
+            job_queue = JobQueue(searches)
+
+            # stats line and metrics endpoint for the run
+            metrics.start(stats[0], stats[1])
+            params = []
+            for i in range(workers):
+                param = {
+                    "searches": job_queue.jobs("worker-{}".format(i + 1)),
+                    "browsers": browsers,
+                    "limiter": limiter,
+                    "output": output_file,
+                    "journal": journal,
+                    "seen": seen,
+                    "parsers": parsers,
+                    "pages": pages,
+                    "tb": tb,
+                    "banned": banned,
+                    "verbose": verbose
+                }
+                params.append(param)
+
+            if workers == 1:
+                search_worker(params[0])
+            else:
+                pool = ThreadPool(workers)
+                try:
+                    pool.map(search_worker, params)
+                    pool.close()
+                    pool.join()
+                except ProgramKilled:
+                    print ("Exit script...")
+                    pool.terminate()
+                    browsers.shutdown()
+                    parsers.shutdown(wait=False)
+                    metrics.stop()
+                    sys.exit(0)
+
+            if verbose:
+                job_queue.report("searches")
+            limiter.report()
+            metrics.stop()
+            metrics.report()
+
+        browsers.shutdown()
+        parsers.shutdown()
+        seen.close()
     except:
         sys.exit(0)
\ No newline at end of file
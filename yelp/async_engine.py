@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import aiohttp
+
+import http_client
+import metrics
+import tracing
+from rate_limiter import is_block_page
+
+
+def run_async(params, concurrency, parse_page, write_page):
+    """
+    Process the yelp pages of params['urls'] on one event loop.
+    At most `concurrency` requests are in flight at the same time.
+    write_page(output, website_url, trace) queues the result of a page.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(process_pages(params, concurrency, parse_page, write_page))
+    finally:
+        loop.close()
+
+
+async def process_pages(params, concurrency, parse_page, write_page):
+    page_urls = iter(params['urls'])
+
+    # the workers of the stats line, each url done counts for the ETA
+    metrics.gauge('workers').set(concurrency)
+    metrics.gauge('queue_depth', page_urls.__length_hint__, queue='jobs')
+    metrics.progress(len(params['urls']), metrics.counter('jobs_done_total'))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=http_client.settings['timeout'])
+    async with aiohttp.ClientSession(headers=http_client.YELP_HEADERS, connector=connector, timeout=timeout) as session:
+        workers = [page_worker(session, page_urls, params, parse_page, write_page) for i in range(concurrency)]
+        await asyncio.gather(*workers)
+
+
+async def page_worker(session, page_urls, params, parse_page, write_page):
+    # every worker pulls the next url from the shared iterator until it is drained
+
+    busy        = metrics.gauge('workers_busy')
+    done        = metrics.counter('jobs_done_total')
+
+    for page_url in page_urls:
+        busy.inc()
+        trace = tracing.begin(page_url)
+        try:
+            await process_page(session, page_url, params, parse_page, write_page, trace)
+        except Exception as e:
+            # a page that can not be parsed fails alone, the other workers go on
+            print ("Could not process the page :", page_url, repr(e))
+            metrics.counter('pages_failed_total', page='biz').inc()
+            trace.finish('failed', error=repr(e))
+        finally:
+            busy.dec()
+            done.inc()
+
+
+async def process_page(session, page_url, params, parse_page, write_page, trace):
+    limiter     = params['limiter']
+    cache       = http_client.cache
+    output      = params['output']
+    parsers     = params['parsers']
+    verbose     = params['verbose']
+
+    # the pages of the loop share the thread, so the spans are closed explicitly instead of with `with`
+    fetch = trace.span('fetch')
+    start = time.time()
+    cached = None
+    if cache is not None:
+        cached = cache.get(page_url)
+
+    if cached is not None:
+        status = cached.status_code
+        text = cached.text
+    else:
+        wait = fetch.span('rate_wait')
+        await limiter.acquire_async(page_url)
+        wait.close()
+        request_start = time.time()
+        request = fetch.span('http')
+        try:
+            async with session.get(page_url) as response:
+                status = response.status
+                content = await response.read()
+                encoding = response.get_encoding()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if isinstance(e, asyncio.TimeoutError):
+                limiter.feedback(page_url, timed_out=True)
+            if verbose == True:
+                print ("Request failed :", page_url, repr(e))
+            metrics.counter('pages_failed_total', page='biz').inc()
+            request.set(error=repr(e))
+            request.close()
+            fetch.close()
+            trace.finish('failed')
+            return
+        finally:
+            metrics.histogram('http_seconds', host=http_client.host_kind(page_url)).observe(time.time() - request_start)
+        request.close()
+
+        limiter.feedback(page_url, status, content)
+
+        text = content.decode(encoding, 'replace')
+        if cache is not None and status == 200 and not is_block_page(content):
+            cache.put(page_url, status, response.headers, content, encoding)
+
+    fetch.close()
+    metrics.histogram('fetch_seconds', page='biz').observe(time.time() - start)
+    if status != 200:
+        metrics.counter('pages_failed_total', page='biz').inc()
+        trace.finish('failed', status_code=status)
+        return
+    metrics.counter('pages_fetched_total', page='biz').inc()
+
+    parse = trace.span('parse')
+    if parsers is not None and parsers.executor is not None:
+        # a thread waits for the parser process, the event loop goes on
+        website_url = await asyncio.get_event_loop().run_in_executor(None, parse_page, text, page_url, verbose)
+    else:
+        website_url = parse_page(text, page_url, verbose)
+    parse.close()
+    write_page(output, website_url, trace)
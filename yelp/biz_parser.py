@@ -0,0 +1,124 @@
+import json
+import re
+from urllib.parse import unquote
+
+from lxml import etree
+
+try:
+    # optional, decodes the ld+json blocks several times faster
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+# errors of a malformed page: broken or unexpected ld+json, html lxml can not read
+PAGE_ERRORS = (ValueError, TypeError, KeyError, etree.LxmlError)
+
+# ld+json blocks are cut out of the raw page, before any DOM is built
+LD_JSON_BLOCK = re.compile(r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.S | re.I)
+
+# precompiled queries, run against the one tree built per page
+HIDDEN_META = etree.XPath('(//div[contains(concat(" ", normalize-space(@class), " "), " hidden ")])[1]//meta[@itemprop=$name]/@content')
+ITEMPROP_TEXT = etree.XPath('string((//span[@itemprop=$name])[1])')
+CATEGORIES = etree.XPath('//a[contains(@href, "/c/")]/text()')
+CLAIMED = etree.XPath('boolean(//span[contains(@class, "checkmark-badged")])')
+WEBSITE_LINK = etree.XPath('(//a[contains(concat(" ", normalize-space(@rel), " "), " noopener ")])[1]/@href')
+
+
+def parse_page(page_source):
+    """
+    Parse the page source once. The get_* functions below take the returned tree.
+    """
+    return etree.HTML(page_source)
+
+
+def get_rating(page_source):
+    """
+    Get the rating value from the last ld+json block of the raw page.
+    None when the page has no ld+json block.
+    """
+    blocks = LD_JSON_BLOCK.findall(page_source)
+    if len(blocks) == 0:
+        return None
+
+    bizObj = loads(blocks[-1].strip())
+
+    ratingValue = 5.0
+    if 'aggregateRating' in bizObj:
+        if 'ratingValue' in bizObj['aggregateRating']:
+            ratingValue = float(bizObj['aggregateRating']['ratingValue'])
+    return ratingValue
+
+
+def get_itemprop(tree, name):
+    return ITEMPROP_TEXT(tree, name=name).strip()
+
+
+def get_hidden_meta(tree, name):
+    values = HIDDEN_META(tree, name=name)
+    if len(values) == 0:
+        return ''
+    return values[0]
+
+
+def get_website_link(tree):
+    links = WEBSITE_LINK(tree)
+    if len(links) == 0:
+        return ''
+    return links[0]
+
+
+def get_website_url(link):
+    # the business website is the url parameter of the yelp redirect link
+    start = link.find('url=')
+    if start == -1:
+        return ''
+    link = link[start + len('url='):]
+    end = link.find('&website')
+    if end != -1:
+        link = link[:end]
+    return unquote(link)
+
+
+def get_business_fields(tree):
+    """
+    Get the business fields of a yelp business page
+    """
+    address_ = [
+        get_itemprop(tree, 'streetAddress'),
+        get_itemprop(tree, 'addressLocality'),
+        get_itemprop(tree, 'addressRegion'),
+        get_itemprop(tree, 'postalCode')
+    ]
+
+    return {
+        "business_name": get_hidden_meta(tree, 'name'),
+        "price_range": get_hidden_meta(tree, 'priceRange'),
+        "category": ', '.join(CATEGORIES(tree)),
+        "phone": get_itemprop(tree, 'telephone'),
+        "address": ' '.join(address_).strip(),
+        "reviews": get_itemprop(tree, 'reviewCount'),
+        "claimed": CLAIMED(tree),
+        "website_link": get_website_link(tree)
+    }
+
+
+# the functions below take the raw page and return a small record,
+# so they can run in the worker processes of parse_pool.ParsePool
+
+def extract_business(page_source, page_url, yelp_rating):
+    """
+    Parse the business of a kept yelp page into an output row.
+    The email slot is filled in by yelp_proc.write_business.
+    """
+    fields = get_business_fields(parse_page(page_source))
+    website_url = get_website_url(fields['website_link'])
+
+    return [fields['business_name'], fields['category'], yelp_rating, fields['price_range'],
+            fields['phone'], fields['address'], '', fields['claimed'], fields['reviews'], website_url, page_url]
+
+
+def extract_website_url(page_source):
+    # the business website of the page, '' when it has none
+    return get_website_url(get_website_link(parse_page(page_source)))
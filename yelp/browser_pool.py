@@ -0,0 +1,198 @@
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+# optional, needed to recycle browsers on memory use
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def browser_memory(driver):
+    """
+    Resident memory in MB of the chromedriver process and the chrome processes under it.
+    0 when psutil is not installed or the processes are gone.
+    """
+    if psutil is None:
+        return 0
+    try:
+        process = psutil.Process(driver.service.process.pid)
+        rss = process.memory_info().rss
+        children = process.children(recursive=True)
+    except (psutil.Error, AttributeError):
+        return 0
+    for child in children:
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss / (1024 * 1024)
+
+
+class PooledBrowser(object):
+    # a driver of the pool and the pages it has loaded
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.started = time.time()
+        self.retired = False
+
+    def retire(self):
+        # quit the browser when it is given back, e.g. after a ban
+        self.retired = True
+
+
+class BrowserPool(object):
+    """
+    Fixed number of browsers leased to the workers one page at a time.
+    The browsers are launched up front, checked before each lease and replaced
+    after max_pages pages or when they use more than max_memory MB.
+    """
+
+    def __init__(self, factory, size=1, max_pages=100, max_memory=0, verbose=False):
+        self.factory = factory
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+        self.verbose = verbose
+        self.cond = threading.Condition()
+        self.idle = []
+        # slots without a browser, launched by the next lease
+        self.empty = size
+        self.closed = False
+        self.launched = 0
+        self.recycled = 0
+        self.failed = 0
+
+        if max_memory and psutil is None:
+            print ("psutil is not installed, browsers are not recycled on memory use")
+
+    def start(self):
+        # chrome takes seconds to start, so the browsers are launched in parallel
+        with self.cond:
+            count = self.empty
+            self.empty = 0
+        if count == 0:
+            return
+
+        pool = ThreadPool(count)
+        browsers = pool.map(self.try_launch, range(count))
+        pool.close()
+        pool.join()
+
+        with self.cond:
+            for browser in browsers:
+                if browser is None:
+                    self.empty += 1
+                else:
+                    self.idle.append(browser)
+            self.cond.notify_all()
+
+    def try_launch(self, slot=None):
+        try:
+            return self.launch()
+        except Exception as e:
+            print ("Could not start the browser :", e)
+            return None
+
+    def launch(self):
+        driver = self.factory()
+        with self.cond:
+            self.launched += 1
+        return PooledBrowser(driver)
+
+    def is_healthy(self, browser):
+        try:
+            browser.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def quit(self, browser):
+        try:
+            browser.driver.quit()
+        except Exception:
+            pass
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                if self.closed:
+                    raise RuntimeError("browser pool is shut down")
+                if self.idle:
+                    browser = self.idle.pop()
+                    break
+                if self.empty > 0:
+                    self.empty -= 1
+                    browser = None
+                    break
+                self.cond.wait()
+
+        if browser is not None:
+            if self.is_healthy(browser):
+                return browser
+            print ("Browser is not responding, starting a new one")
+            self.quit(browser)
+            with self.cond:
+                self.failed += 1
+
+        try:
+            return self.launch()
+        except Exception:
+            # give the slot back, the next lease tries again
+            with self.cond:
+                self.empty += 1
+                self.cond.notify()
+            raise
+
+    def release(self, browser):
+        browser.pages += 1
+
+        if not browser.retired and self.max_pages and browser.pages >= self.max_pages:
+            if self.verbose:
+                print ("Recycling browser after {} pages".format(browser.pages))
+            browser.retired = True
+
+        if not browser.retired and self.max_memory:
+            memory = browser_memory(browser.driver)
+            if memory > self.max_memory:
+                if self.verbose:
+                    print ("Recycling browser using {:.0f}MB".format(memory))
+                browser.retired = True
+
+        if browser.retired or self.closed:
+            self.quit(browser)
+            with self.cond:
+                if browser.retired:
+                    self.recycled += 1
+                self.empty += 1
+                self.cond.notify()
+            return
+
+        with self.cond:
+            self.idle.append(browser)
+            self.cond.notify()
+
+    @contextmanager
+    def lease(self):
+        browser = self.acquire()
+        try:
+            yield browser
+        finally:
+            self.release(browser)
+
+    def shutdown(self):
+        with self.cond:
+            self.closed = True
+            browsers = self.idle
+            self.idle = []
+            self.cond.notify_all()
+        for browser in browsers:
+            self.quit(browser)
+
+    def report(self):
+        print ("Browsers : {} launched, {} recycled, {} replaced after failing a check".format(
+            self.launched, self.recycled, self.failed))
@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+
+
+def read_json_lines(path):
+    """
+    Records of a json lines file, the partly written last line of an interrupted run is skipped.
+    Returns the records and True when the file ends in such a line.
+    """
+    records = []
+    line = '\n'
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records, not line.endswith('\n')
+
+
+def open_json_lines(path, partial_line=False):
+    # open for appending, after a partly written line the next record starts on its own line
+    f = open(path, 'a', encoding='utf-8')
+    if partial_line:
+        f.write('\n')
+    return f
+
+
+class ProgressJournal(object):
+    """
+    Append-only journal of finished work, one json line per finished key.
+    A restarted run loads it and skips the keys that are already done.
+    Keys are strings or tuples, e.g. a biz url or (city, category, page).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+
+        partial_line = False
+        if os.path.exists(path):
+            partial_line = self.load()
+        self.file = open_json_lines(path, partial_line)
+
+    def load(self):
+        # returns True when the file ends in a partly written line
+        records, partial_line = read_json_lines(self.path)
+        for record in records:
+            key = record.pop('key')
+            if isinstance(key, list):
+                key = tuple(key)
+            self.done[key] = record
+        return partial_line
+
+    def resuming(self):
+        return len(self.done) > 0
+
+    def is_done(self, key):
+        return key in self.done
+
+    def get(self, key):
+        # info recorded with the key, None when it is not done
+        return self.done.get(key)
+
+    def mark_done(self, key, **info):
+        """
+        Record the key as done. Write its output before, so it is on disk when the key is.
+        """
+        record = dict(info)
+        record['key'] = key
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self.done[key] = info
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
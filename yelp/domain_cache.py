@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from checkpoint import read_json_lines, open_json_lines
+
+# optional, the public suffix list with its private section(blogspot.com, wixsite.com, ...)
+try:
+    import tldextract
+    # the snapshot of the package, no download at run time
+    extract = tldextract.TLDExtract(suffix_list_urls=(), include_psl_private_domains=True)
+except ImportError:
+    extract = None
+
+
+# hosts serving the websites of many businesses under their paths, e.g. facebook.com/<page>
+SHARED_HOSTS = ('facebook.com', 'instagram.com', 'sites.google.com', 'wixsite.com', 'linktr.ee')
+
+# domains giving each business a host of its own, missing from the public suffix list
+HOSTING_DOMAINS = ('business.site',)
+
+
+def under(host, domains):
+    for domain in domains:
+        if host == domain or host.endswith('.' + domain):
+            return True
+    return False
+
+
+def is_ip(host):
+    return host.replace('.', '').isdigit() or ':' in host
+
+
+def url_parts(url):
+    if '//' not in url:
+        url = 'http://' + url
+    parts = urlparse(url)
+    return (parts.hostname or '').lower().rstrip('.'), parts
+
+
+def registered_domain(url):
+    """
+    Get the registered domain of the url, e.g. shop.example.co.uk -> example.co.uk.
+    Without tldextract it is the host without www., shop.example.co.uk stays as it is
+    """
+    host, parts = url_parts(url)
+    if is_ip(host) or under(host, HOSTING_DOMAINS):
+        return host
+
+    if extract is not None:
+        found = extract(host)
+        if found.domain and found.suffix:
+            return found.domain + '.' + found.suffix
+        return host
+    if host.startswith('www.'):
+        return host[4:]
+    return host
+
+
+def site_key(url):
+    """
+    Key of the website of the url for the email crawls and their cache: the registered domain,
+    or the exact site url(host, port and path) on a shared host or an ip address
+    """
+    host, parts = url_parts(url)
+    if not (is_ip(host) or under(host, SHARED_HOSTS)):
+        return registered_domain(url)
+
+    netloc = parts.netloc.lower()
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    return netloc + parts.path.rstrip('/')
+
+
+class DomainEmailCache(object):
+    """
+    Emails found per website(site_key), with the time of the crawl.
+    With a path, results are appended to a json-lines file and loaded by later runs.
+    """
+
+    def __init__(self, path=None, ttl=30 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.results = {}
+        # the first record put after a partly written line starts a new line
+        self.partial_line = False
+
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        records, self.partial_line = read_json_lines(self.path)
+        for record in records:
+            self.results[record['domain']] = record
+
+    def get(self, domain):
+        # emails of the website, None when it was not crawled or the result expired
+
+        with self.lock:
+            record = self.results.get(domain)
+        if record is None or time.time() - record['ts'] > self.ttl:
+            return None
+        return list(record['emails'])
+
+    def put(self, domain, emails):
+        record = {"domain": domain, "emails": list(emails), "ts": time.time()}
+        with self.lock:
+            self.results[domain] = record
+            if self.path:
+                with open_json_lines(self.path, self.partial_line) as f:
+                    f.write(json.dumps(record) + '\n')
+                self.partial_line = False
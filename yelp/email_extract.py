@@ -0,0 +1,88 @@
+import re
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+
+EMAIL = r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]{2,3}"
+EMAIL_PATTERN = re.compile(EMAIL)
+# the pattern is ascii only, so raw utf-8 bytes can be scanned without decoding them
+EMAIL_PATTERN_BYTES = re.compile(EMAIL.encode('ascii'))
+
+VALID = r'^\w+([\.-]?\w+)*@\w+([\.-]?\w+)*(\.\w{2,3})+$'
+VALID_PATTERN = re.compile(VALID)
+# one candidate per line, so a whole batch is checked in a single scan
+VALID_LINES_PATTERN = re.compile(VALID, re.M)
+
+
+def find_mail_address(html_corpus=None):
+    """
+    Find the email addresses of the page, lowercased and in order of appearance.
+    html_corpus is either the decoded page or its raw bytes.
+    """
+    if not html_corpus:
+        return []
+
+    if isinstance(html_corpus, bytes):
+        emails = [email.decode('ascii').lower() for email in EMAIL_PATTERN_BYTES.findall(html_corpus)]
+    else:
+        emails = [email.lower() for email in EMAIL_PATTERN.findall(html_corpus)]
+
+    # dict keeps the first occurrence and drops duplicates in O(1)
+    return list(dict.fromkeys(emails))
+
+
+def is_valid(email):
+    # check email validation
+
+    return VALID_PATTERN.search(email) is not None
+
+
+def validate_batch(emails):
+    """
+    Get the set of valid addresses among the candidates of a page
+    """
+    candidates = [email for email in emails if '\n' not in email]
+    if len(candidates) == 0:
+        return set()
+
+    return {m.group(0) for m in VALID_LINES_PATTERN.finditer('\n'.join(candidates))}
+
+
+def in_same_domain(source=None, target=None):
+    # check domain status
+
+    if all([type(source) == list, type(target) == str]):
+        return source == urlparse(target).netloc.split('.')[-len(source):]
+    return False
+
+
+def fetch_links(html_corpus=None, domain_name=None, dn_as_list=None, visited_links=None):
+    # get links at page
+    
+    links = []
+    if all([html_corpus, domain_name, type(visited_links) == set, type(dn_as_list) == list]):
+        for link in html_corpus.find_all('a'):
+            link = link.get('href', None)
+            if link and not link.startswith('#'):
+                if link.startswith('/'):
+                    to_traverse = "{}{}".format(domain_name, link)
+                    if to_traverse not in visited_links:
+                        links.append(to_traverse)
+                elif '.htm' in link and 'http' not in link:
+                    to_traverse = "{}{}".format(domain_name, link)
+                    if to_traverse not in visited_links:
+                        links.append(to_traverse)                        
+                elif in_same_domain(dn_as_list, link) and link not in visited_links:
+                    links.append(link)
+    return links
+
+
+def parse_site_page(html_corpus, domain_name, dn_as_list):
+    """
+    Links and email addresses of a page of a business website, given its raw bytes.
+    Runs in the worker processes of parse_pool.ParsePool, the links are not checked
+    against the visited pages of the crawl.
+    """
+    soup = BeautifulSoup(html_corpus, "lxml")
+    return fetch_links(soup, domain_name, dn_as_list, set()), find_mail_address(html_corpus)
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from requests.structures import CaseInsensitiveDict
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url):
+    """
+    Normalise the url for the cache key: lowercase scheme and host,
+    no default port, no fragment and sorted query parameters
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = "{}:{}".format(host, parts.port)
+    path = parts.path or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+def cache_key(url):
+    return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+
+class CachedResponse(object):
+    """
+    Response read from the cache, with the fields of requests.Response the scrapers use
+    """
+
+    def __init__(self, url, status_code, headers, content, encoding, fetched_at):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.encoding = encoding
+        self.fetched_at = fetched_at
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', 'replace')
+
+
+class HttpCache(object):
+    """
+    Disk cache of responses keyed on the normalised url.
+    Every entry is a body file and a json file with the url, status, headers and fetch time.
+    Entries expire after ttl seconds, and the least recently used ones are
+    evicted when the cache grows over max_bytes.
+    """
+
+    def __init__(self, directory, ttl=7 * 24 * 3600, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # key -> [size, last access], kept in memory for the eviction
+        self.entries = {}
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.scan()
+
+    def scan(self):
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.body'):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                key = name[:-len('.body')]
+                self.entries[key] = [stat.st_size, stat.st_mtime]
+                self.total += stat.st_size
+
+    def paths(self, key):
+        folder = os.path.join(self.directory, key[:2])
+        return os.path.join(folder, key + '.body'), os.path.join(folder, key + '.json')
+
+    def get(self, url):
+        """
+        Get the cached response of the url, None when it is missing or expired
+        """
+        key = cache_key(url)
+        body_path, meta_path = self.paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if time.time() - meta['fetched_at'] > self.ttl:
+                self.remove(key)
+                with self.lock:
+                    self.misses += 1
+                return None
+            with open(body_path, 'rb') as f:
+                content = f.read()
+            now = time.time()
+            os.utime(body_path, (now, now))
+        except (IOError, OSError, ValueError, KeyError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+            if key in self.entries:
+                self.entries[key][1] = now
+        return CachedResponse(meta['url'], meta['status'], meta['headers'], content, meta.get('encoding'), meta['fetched_at'])
+
+    def put(self, url, status_code, headers, content, encoding=None):
+        key = cache_key(url)
+        body_path, meta_path = self.paths(key)
+        meta = {
+            "url": url,
+            "status": status_code,
+            "headers": dict(headers),
+            "encoding": encoding,
+            "fetched_at": time.time()
+        }
+
+        # written aside and renamed, so readers never see a half written entry
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        suffix = '.{}.tmp'.format(threading.get_ident())
+        with open(body_path + suffix, 'wb') as f:
+            f.write(content)
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(body_path + suffix, body_path)
+        os.replace(meta_path + suffix, meta_path)
+
+        with self.lock:
+            old = self.entries.get(key)
+            if old is not None:
+                self.total -= old[0]
+            self.entries[key] = [len(content), time.time()]
+            self.total += len(content)
+            over = self.total > self.max_bytes
+        if over:
+            self.evict()
+
+    def remove_url(self, url):
+        self.remove(cache_key(url))
+
+    def remove(self, key):
+        for path in self.paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.total -= entry[0]
+
+    def evict(self):
+        # drop the least recently used entries down to 90% of max_bytes
+
+        with self.lock:
+            target = self.max_bytes * 0.9
+            victims = []
+            total = self.total
+            for key, entry in sorted(self.entries.items(), key=lambda item: item[1][1]):
+                if total <= target:
+                    break
+                victims.append(key)
+                total -= entry[0]
+        for key in victims:
+            self.remove(key)
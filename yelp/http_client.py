@@ -0,0 +1,120 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from rate_limiter import is_block_page
+
+
+DEFAULT_HEADERS = {
+    'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/76.0.3809.132 Safari/537.36',
+    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3',
+}
+
+YELP_HEADERS = {'Accept':'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Encoding':'gzip, deflate, br',
+    'Accept-Language':'en-GB,en;q=0.9,en-US;q=0.8,ml;q=0.7',
+    'Cache-Control':'max-age=0',
+    'Connection':'keep-alive',
+    'Host':'www.yelp.com',
+    'Upgrade-Insecure-Requests':'1',
+    'User-Agent':'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/64.0.3282.140 Safari/537.36'
+}
+
+settings = {
+    # number of hosts whose connection pools are kept alive
+    "pool_hosts": 100,
+    # keep-alive connections per host
+    "pool_size": 16,
+    "timeout": 60
+}
+
+lock = threading.Lock()
+session = None
+rate_limiter = None
+cache = None
+
+
+def configure(pool_hosts=None, pool_size=None, timeout=None, limiter=None, response_cache=None):
+    """
+    Change the pool sizes, the timeout, the rate limiter and the response cache.
+    Call it before the first request.
+    """
+    global session, rate_limiter, cache
+
+    with lock:
+        if limiter:
+            rate_limiter = limiter
+        if response_cache:
+            cache = response_cache
+        if pool_hosts:
+            settings['pool_hosts'] = pool_hosts
+        if pool_size:
+            settings['pool_size'] = pool_size
+        if timeout:
+            settings['timeout'] = timeout
+        if session is not None:
+            session.close()
+            session = None
+
+
+def get_session():
+    """
+    Get the session shared by all threads.
+    Its adapters keep a pool of keep-alive connections per host.
+    """
+    global session
+
+    with lock:
+        if session is None:
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            adapter = HTTPAdapter(pool_connections=settings['pool_hosts'], pool_maxsize=settings['pool_size'])
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return session
+
+
+def host_kind(url):
+    # yelp or site, the label of the request metrics
+    host = urlparse(url).netloc.lower()
+    if host == 'yelp.com' or host.endswith('.yelp.com'):
+        return 'yelp'
+    return 'site'
+
+
+def get(url, headers=None, timeout=None):
+    """
+    GET the url over a pooled connection, within the budget of the rate limiter.
+    A cache hit skips both the network and the rate limiter.
+    """
+    if cache is not None:
+        cached = cache.get(url)
+        if cached is not None:
+            return cached
+
+    if timeout is None:
+        timeout = settings['timeout']
+    if rate_limiter is not None:
+        rate_limiter.acquire(url)
+    start = time.time()
+    try:
+        r = get_session().get(url, headers=headers, timeout=timeout)
+    except requests.Timeout:
+        if rate_limiter is not None:
+            rate_limiter.feedback(url, timed_out=True)
+        raise
+    finally:
+        metrics.histogram('http_seconds', host=host_kind(url)).observe(time.time() - start)
+
+    # block pages and 429/503 slow the adaptive rate down
+    if rate_limiter is not None:
+        rate_limiter.feedback(url, r.status_code, r.content)
+
+    # the block page comes with a 200 too, it is never kept
+    if cache is not None and r.status_code == 200 and not is_block_page(r.content):
+        cache.put(url, r.status_code, r.headers, r.content, r.encoding)
+    return r
@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+
+import http_client
+import tracing
+import biz_parser
+from rate_limiter import is_block_page
+
+
+def is_business_page(text):
+    # the page has the business ld+json and is not the block page
+    if is_block_page(text):
+        return False
+    return biz_parser.LD_JSON_BLOCK.search(text) is not None
+
+
+class HybridFetcher(object):
+    """
+    Fetch a yelp page with a plain http request and load it in a browser only
+    when the response is not a business page. The path taken is recorded per url:
+    cache, http, browser or failed.
+    """
+
+    def __init__(self, browser_load, cache=None, log_path=None):
+        # browser_load(page_url) returns the page source or None
+        self.browser_load = browser_load
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.counts = {'cache': 0, 'http': 0, 'browser': 0, 'failed': 0}
+        self.log = None
+        if log_path:
+            self.log = open(log_path, 'a', encoding='utf-8')
+
+    def fetch_http(self, page_url):
+        # page text and where it came from, or None and why it can not be used
+        try:
+            r = http_client.get(page_url, headers=http_client.YELP_HEADERS)
+        except Exception:
+            return None, 'request error'
+        if r.status_code != 200:
+            return None, 'status {}'.format(r.status_code)
+
+        text = r.text
+        if not is_business_page(text):
+            # do not keep a page without the business in the cache
+            if self.cache is not None:
+                self.cache.remove_url(page_url)
+            if is_block_page(text):
+                return None, 'block page'
+            return None, 'no ld+json'
+
+        if getattr(r, 'from_cache', False):
+            return text, 'cache'
+        return text, 'http'
+
+    def __call__(self, page_url):
+        start = time.time()
+        with tracing.span('http') as span:
+            text, reason = self.fetch_http(page_url)
+            span.set(result=reason)
+        if text is not None:
+            path = reason
+            reason = None
+        else:
+            text = self.browser_load(page_url)
+            path = 'browser' if text is not None else 'failed'
+
+        self.record(page_url, path, reason, time.time() - start)
+        return text
+
+    def record(self, page_url, path, reason, seconds):
+        with self.lock:
+            self.counts[path] += 1
+            if self.log is not None:
+                line = {"url": page_url, "path": path, "reason": reason, "seconds": round(seconds, 3)}
+                self.log.write(json.dumps(line) + '\n')
+                self.log.flush()
+
+    def close(self):
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+
+    def report(self):
+        with self.lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        if total == 0:
+            return
+        print ("Fetch paths : {} pages, {} cache, {} http, {} browser, {} failed".format(
+            total, counts['cache'], counts['http'], counts['browser'], counts['failed']))
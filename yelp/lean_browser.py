@@ -0,0 +1,92 @@
+import threading
+
+# images, fonts, css, media and trackers the scrapers never use.
+# blocked through the devtools protocol, so they are not even requested.
+BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.css',
+    '*.mp4', '*.webm', '*.mp3',
+    '*google-analytics.com*', '*googletagmanager.com*', '*googletagservices.com*',
+    '*doubleclick.net*', '*googlesyndication.com*', '*googleadservices.com*',
+    '*facebook.net*', '*facebook.com/tr*', '*connect.facebook.com*',
+    '*scorecardresearch.com*', '*quantserve.com*', '*adsrvr.org*',
+    '*amazon-adsystem.com*', '*criteo.com*', '*criteo.net*', '*bat.bing.com*',
+    '*hotjar.com*', '*newrelic.com*', '*nr-data.net*',
+]
+
+# chrome preferences, images are also turned off in case the blocking fails
+LEAN_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.default_content_setting_values.notifications': 2,
+    'profile.managed_default_content_settings.plugins': 2,
+    'profile.managed_default_content_settings.popups': 2,
+    'profile.managed_default_content_settings.geolocation': 2,
+    'profile.managed_default_content_settings.media_stream': 2,
+}
+
+# driver.get returns at DOMContentLoaded instead of waiting for the load event
+LEAN_CAPABILITIES = {'pageLoadStrategy': 'eager'}
+
+# bytes and requests of the loaded page, from the resource timing api.
+# cross-origin responses without Timing-Allow-Origin report 0 bytes.
+PAGE_METRICS_SCRIPT = """
+var nav = performance.getEntriesByType('navigation')[0];
+var resources = performance.getEntriesByType('resource');
+var bytes = nav ? nav.transferSize : 0;
+for (var i = 0; i < resources.length; i++) {
+    bytes += resources[i].transferSize || 0;
+}
+return {bytes: bytes, requests: resources.length + 1};
+"""
+
+
+def lean_options(options):
+    # add the lean settings to chrome options
+    options.add_experimental_option('prefs', LEAN_PREFS)
+    options.add_argument('--blink-settings=imagesEnabled=false')
+    options.add_argument('--disable-extensions')
+    options.add_argument('--mute-audio')
+    return options
+
+
+def block_urls(driver, patterns=None):
+    # stop the browser from requesting the urls matching the patterns
+    if patterns is None:
+        patterns = BLOCKED_URLS
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+
+
+def page_metrics(driver):
+    # bytes transferred and requests made by the current page, None when not available
+    try:
+        return driver.execute_script(PAGE_METRICS_SCRIPT)
+    except Exception:
+        return None
+
+
+class PageStats(object):
+    # bytes and load time of the pages loaded in the browsers
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.bytes = 0
+        self.requests = 0
+        self.seconds = 0.0
+
+    def add(self, metrics, seconds):
+        with self.lock:
+            self.pages += 1
+            self.seconds += seconds
+            if metrics:
+                self.bytes += metrics.get('bytes', 0)
+                self.requests += metrics.get('requests', 0)
+
+    def report(self):
+        if self.pages == 0:
+            return
+        print ("Browser pages : {}, {:.1f} KB, {:.1f} requests and {:.2f}s per page".format(
+            self.pages, self.bytes / 1024.0 / self.pages, self.requests / float(self.pages),
+            self.seconds / self.pages))
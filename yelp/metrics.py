@@ -0,0 +1,383 @@
+"""
+Counters, gauges and latency histograms of a run, kept in one registry per process.
+The registry is shown as a stats line every few seconds, as a summary at the end(report)
+and, when a port is given, as prometheus text on http://127.0.0.1:<port>/metrics.
+"""
+import bisect
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+# prefix of the prometheus metric names
+PREFIX = 'yelp_'
+
+# upper bounds in seconds of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    'pages_fetched_total': 'pages fetched, by page kind',
+    'pages_failed_total': 'pages that could not be fetched, by page kind',
+    'pages_rejected_total': 'business pages left out, rating above the threshold or no rating',
+    'bans_total': 'yelp.com block pages, 429/503 and timeouts, by reason',
+    'emails_found_total': 'valid email addresses found on the business websites',
+    'links_found_total': 'new business links of the search pages',
+    'rows_written_total': 'output rows flushed',
+    'jobs_done_total': 'urls or searches finished by the workers',
+    'jobs': 'urls or searches of the run',
+    'worker_busy_seconds_total': 'seconds the workers spent on their jobs',
+    'workers': 'workers taking jobs',
+    'workers_busy': 'workers busy with a job',
+    'queue_depth': 'items waiting in a queue',
+    'fetch_seconds': 'time to get a page, by page kind',
+    'browser_load_seconds': 'time chrome takes to load a yelp page',
+    'http_seconds': 'time of a plain http request, yelp.com or a business website',
+    'rate_wait_seconds': 'time waited for the rate limit of yelp.com or a business website',
+    'rate_per_second': 'requests per second allowed to yelp.com by --adaptive',
+    'parse_seconds': 'time to parse a page, by page kind',
+    'email_crawl_seconds': 'time to crawl a business website for emails',
+    'output_write_seconds': 'time to write and flush a batch of output rows',
+}
+
+
+def label_text(labels):
+    if not labels:
+        return ''
+    values = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        values.append('{}="{}"'.format(key, value))
+    return '{' + ','.join(values) + '}'
+
+
+def short_name(name, labels):
+    # name of the stats line, e.g. fetch[biz]
+    for suffix in ('_total', '_seconds'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if labels:
+        name += '[' + ','.join(str(value) for key, value in labels) + ']'
+    return name
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '{}h{:02d}m'.format(seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60:
+        return '{}m{:02d}s'.format(seconds // 60, seconds % 60)
+    return '{}s'.format(seconds)
+
+
+def format_number(value):
+    # rounded for the stats line and the summary
+    if isinstance(value, float) and not value.is_integer():
+        return '{:.2f}'.format(value)
+    return str(int(value))
+
+
+def exposition_number(value):
+    # full precision for prometheus, e.g. an adaptive rate of 0.004 requests/s
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+        return self.value
+
+
+class Gauge(object):
+    # a value set by the code, or read from fn when it is shown
+    kind = 'gauge'
+
+    def __init__(self, fn=None):
+        self.lock = threading.Lock()
+        self.value = 0
+        self.fn = fn
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def get(self):
+        if self.fn is not None:
+            try:
+                return self.fn()
+            except Exception:
+                return 0
+        return self.value
+
+
+class Histogram(object):
+    """
+    Count of the observed seconds per bucket for prometheus, and the latest
+    observations for the percentiles of the stats line and the summary.
+    """
+    kind = 'histogram'
+
+    def __init__(self, buckets=BUCKETS):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.latest = deque(maxlen=10000)
+
+    def observe(self, seconds):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            self.max = max(self.max, seconds)
+            self.latest.append(seconds)
+
+    def percentiles(self, *qs):
+        with self.lock:
+            latest = sorted(self.latest)
+        if not latest:
+            return [0.0 for q in qs]
+        return [latest[min(len(latest) - 1, int(len(latest) * q))] for q in qs]
+
+
+class Registry(object):
+    # metrics by name and labels, created on first use
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.started = time.time()
+        self.total = None
+        self.done = None
+        self.progress_started = None
+
+    def get(self, cls, name, labels, fn=None):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = cls(fn) if fn is not None else cls()
+                self.metrics[key] = metric
+            elif fn is not None:
+                metric.fn = fn
+            return metric
+
+    def counter(self, name, **labels):
+        return self.get(Counter, name, labels)
+
+    def gauge(self, name, fn=None, **labels):
+        return self.get(Gauge, name, labels, fn)
+
+    def histogram(self, name, **labels):
+        return self.get(Histogram, name, labels)
+
+    def progress(self, total, done):
+        # jobs of the run and the counter of the finished ones, for the ETA
+        self.total = total
+        self.done = done
+        self.progress_started = time.time()
+
+    def items(self):
+        with self.lock:
+            return sorted(self.metrics.items(), key=lambda item: item[0])
+
+    def eta(self):
+        # done/total, rate and estimated time left, None without progress
+        if self.total is None or self.done is None:
+            return None
+        done = self.done.get()
+        elapsed = time.time() - self.progress_started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        text = '{}/{} done, {:.2f}/s'.format(done, self.total, rate)
+        if rate > 0 and done < self.total:
+            text += ', ETA {}'.format(format_seconds((self.total - done) / rate))
+        return text
+
+    def stats_line(self):
+        parts = [format_seconds(time.time() - self.started)]
+        eta = self.eta()
+        if eta is not None:
+            parts.append(eta)
+
+        # counts, then the gauges, then the latencies
+        metrics = sorted(self.items(), key=lambda item: ('counter', 'gauge', 'histogram').index(item[1].kind))
+        for (name, labels), metric in metrics:
+            short = short_name(name, labels)
+            if metric.kind == 'histogram':
+                if metric.count > 0:
+                    p50, p90 = metric.percentiles(0.5, 0.9)
+                    parts.append('{} p50 {:.3f}s p90 {:.3f}s'.format(short, p50, p90))
+            elif name.endswith('_seconds_total'):
+                continue
+            elif metric.get() or metric.kind == 'gauge':
+                parts.append('{} {}'.format(short, format_number(metric.get())))
+        return 'Stats : ' + ', '.join(parts)
+
+    def render(self):
+        # prometheus text format
+        lines = []
+        described = set()
+        for (name, labels), metric in self.items():
+            full = PREFIX + name
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP {} {}'.format(full, HELP.get(name, name)))
+                lines.append('# TYPE {} {}'.format(full, metric.kind))
+
+            if metric.kind != 'histogram':
+                lines.append('{}{} {}'.format(full, label_text(labels), exposition_number(metric.get())))
+                continue
+
+            with metric.lock:
+                counts = list(metric.counts)
+                count = metric.count
+                total = metric.sum
+            cumulative = 0
+            for bound, n in zip(list(metric.buckets) + ['+Inf'], counts):
+                cumulative += n
+                lines.append('{}_bucket{} {}'.format(full, label_text(labels + (('le', bound),)), cumulative))
+            lines.append('{}_sum{} {:.6f}'.format(full, label_text(labels), total))
+            lines.append('{}_count{} {}'.format(full, label_text(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        # counters on one line, a line per histogram. gauges are left out, they are of the moment
+        print ("Metrics after {:.1f}s :".format(time.time() - self.started))
+        values = []
+        for (name, labels), metric in self.items():
+            if metric.kind != 'counter' or name.endswith('_seconds_total'):
+                continue
+            if metric.get():
+                values.append('{} {}'.format(short_name(name, labels), format_number(metric.get())))
+        if values:
+            print ("  " + ", ".join(values))
+
+        for (name, labels), metric in self.items():
+            if metric.kind != 'histogram' or metric.count == 0:
+                continue
+            p50, p90, p99 = metric.percentiles(0.5, 0.9, 0.99)
+            print ("  {} : {} in {:.1f}s, mean {:.3f}s p50 {:.3f}s p90 {:.3f}s p99 {:.3f}s max {:.3f}s".format(
+                short_name(name, labels), metric.count, metric.sum, metric.sum / metric.count,
+                p50, p90, p99, metric.max))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port, registry):
+        # local only, the metrics are not meant for other hosts
+        HTTPServer.__init__(self, ('127.0.0.1', port), MetricsHandler)
+        self.registry = registry
+
+
+class StatsReporter(object):
+    # thread printing the stats line every interval seconds
+
+    def __init__(self, registry, interval):
+        self.registry = registry
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="stats-reporter")
+        self.thread.daemon = True
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            print (self.registry.stats_line())
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+
+registry = Registry()
+reporter = None
+server = None
+
+
+def counter(name, **labels):
+    return registry.counter(name, **labels)
+
+
+def gauge(name, fn=None, **labels):
+    return registry.gauge(name, fn, **labels)
+
+
+def histogram(name, **labels):
+    return registry.histogram(name, **labels)
+
+
+def progress(total, done):
+    registry.progress(total, done)
+
+
+def start(interval=0, port=None):
+    """
+    Print the stats line every interval seconds(0: never) and serve the
+    metrics on 127.0.0.1:port when a port is given.
+    """
+    global reporter, server
+
+    if interval and interval > 0:
+        reporter = StatsReporter(registry, interval)
+        reporter.start()
+    if port:
+        try:
+            server = MetricsServer(port, registry)
+        except OSError as e:
+            print ("Could not serve the metrics on port {} : {}".format(port, e))
+            return
+        thread = threading.Thread(target=server.serve_forever, name="metrics-server")
+        thread.daemon = True
+        thread.start()
+        print ("Metrics : http://127.0.0.1:{}/metrics".format(server.server_address[1]))
+
+
+def stop():
+    if reporter is not None:
+        reporter.stop()
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+def report():
+    registry.report()
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import metrics
+
+FSYNC_POLICIES = ['none', 'batch', 'close']
+
+# end of the output, put on the queue by close
+CLOSE = object()
+
+
+class OutputWriter(object):
+    """
+    Writer thread owning the output sink(result_sink.py). Workers hand over rows and go on,
+    the thread writes them in batches and flushes every batch_size rows or
+    flush_interval seconds. fsync: none, after every batch, or once on close.
+    """
+
+    def __init__(self, sink, batch_size=100, flush_interval=1.0, fsync='none'):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.queue = queue.Queue()
+        self.closed = False
+
+        self.rows = 0
+        self.batches = 0
+        self.write_time = 0.0
+        # seconds from write() to the rows being flushed, of the latest rows
+        self.latencies = deque(maxlen=10000)
+        metrics.gauge('queue_depth', self.queue.qsize, queue='output')
+
+        self.thread = threading.Thread(target=self.run, name="output-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, rows, on_written=None):
+        """
+        Queue the rows, on_written is called once they are flushed.
+        """
+        self.queue.put((time.time(), rows, on_written))
+
+    def run(self):
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.time())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is CLOSE:
+                self.write_batch(batch)
+                if self.fsync == 'close':
+                    self.sync()
+                return
+
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.time() + self.flush_interval
+
+            rows = sum(len(entry[1]) for entry in batch)
+            if batch and (rows >= self.batch_size or time.time() >= deadline):
+                self.write_batch(batch)
+                batch = []
+                deadline = None
+
+    def write_batch(self, batch):
+        if not batch:
+            return
+        start = time.time()
+        rows = []
+        for entry in batch:
+            rows.extend(entry[1])
+        try:
+            self.sink.write_rows(rows)
+            self.sink.flush()
+        except Exception as e:
+            # the rows are lost, their callbacks are not called
+            print ("Output write error :", e)
+            return
+        if self.fsync == 'batch':
+            self.sync()
+        done = time.time()
+
+        self.batches += 1
+        self.write_time += done - start
+        metrics.histogram('output_write_seconds').observe(done - start)
+        metrics.counter('rows_written_total').inc(len(rows))
+        for queued, rows, on_written in batch:
+            self.rows += len(rows)
+            self.latencies.append(done - queued)
+            if on_written is not None:
+                try:
+                    on_written()
+                except Exception as e:
+                    print ("Output callback error :", e)
+
+    def sync(self):
+        try:
+            self.sink.sync()
+        except Exception as e:
+            print ("Output sync error :", e)
+
+    def close(self):
+        # write what is queued, stop the thread and close the sink. only the first call does it
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(CLOSE)
+        self.thread.join()
+        self.sink.close()
+
+    def report(self):
+        if self.batches == 0:
+            return
+        latencies = sorted(self.latencies)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print ("Output : {} rows in {} batches, {:.2f}ms a batch, queued to flushed p50 {:.3f}s p99 {:.3f}s max {:.3f}s".format(
+            self.rows, self.batches, self.write_time / self.batches * 1000, p50, p99, latencies[-1]))
@@ -0,0 +1,44 @@
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+
+def call(fn, args):
+    # runs in a worker process, ctrl-c is handled by the parent alone
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    return fn(*args)
+
+
+class ParsePool(object):
+    """
+    Parses pages in worker processes, so the parsing of all fetch threads is spread
+    over as many cores instead of taking turns on the GIL.
+    The fetch thread hands the raw page over once and gets back the small record
+    the parse function returns. fn must be a module level function.
+    workers=0 parses in the calling thread, as before.
+    """
+
+    def __init__(self, workers=0):
+        self.workers = workers
+        self.executor = None
+        if workers > 0:
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def start(self):
+        # start the processes now, before the other threads of the script
+        if self.executor is not None:
+            futures = [self.executor.submit(call, os.getpid, ()) for i in range(self.workers)]
+            for future in futures:
+                future.result()
+
+    def run(self, fn, *args):
+        """
+        fn(*args) in a worker process, blocks until it is done.
+        """
+        if self.executor is None:
+            return fn(*args)
+        return self.executor.submit(call, fn, args).result()
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait)
@@ -0,0 +1,467 @@
+import argparse
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from functools import partial
+
+# the search stage runs yelpsearch.py of the yelp-search folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'yelp-search'))
+
+import http_client
+import metrics
+import tracing
+import biz_parser
+import yelp_proc
+import yelpsearch
+from browser_pool import BrowserPool
+from hybrid_fetch import HybridFetcher
+from link_filter import FingerprintSet
+from output_writer import OutputWriter
+from parse_pool import ParsePool
+from result_sink import open_sink, SINKS
+from domain_cache import DomainEmailCache, registered_domain
+from rate_limiter import RateLimiter
+from spamtrap import SpamtrapMatcher
+
+
+STAGES = ['search', 'biz', 'email', 'output']
+
+# keys of the business records passed between the stages, in the order of yelp_proc.OUTPUT_FIELDS
+RECORD_KEYS = ['business_name', 'category', 'rating', 'price_range', 'phone', 'address',
+               'email', 'claimed', 'reviews', 'website_url', 'yelp_url']
+
+# end of the stream, passed on by each stage when its input is done
+DONE = object()
+
+# traces of the businesses after the biz stage, by yelp url, taken by the last stage.
+# the worker threads of all stages share them under traces_lock
+traces = {}
+traces_lock = threading.Lock()
+
+
+class ProgramKilled(Exception):
+    pass
+
+
+def signal_handler(signum, frame):
+    raise ProgramKilled
+
+
+class Stage(object):
+    """
+    Worker threads taking items from the inbox and handing them to the handler,
+    which passes its results on with emit. The queues between the stages are bounded,
+    so a stage that falls behind holds up the stages before it instead of piling up items.
+    """
+
+    def __init__(self, name, handler, workers, inbox, outbox):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.inbox = inbox
+        self.outbox = outbox
+        self.lock = threading.Lock()
+        self.running = 0
+        self.received = 0
+        self.emitted = 0
+        self.first_emit = None
+        self.threads = []
+        # busy workers and the waiting items of the stage, for the stats line
+        self.busy = metrics.gauge('workers_busy', stage=name)
+        metrics.gauge('workers', stage=name).set(workers)
+        metrics.gauge('queue_depth', inbox.qsize, queue=name)
+
+    def emit(self, item):
+        with self.lock:
+            self.emitted += 1
+            if self.first_emit is None:
+                self.first_emit = time.time()
+        if self.outbox is not None:
+            self.outbox.put(item)
+
+    def start(self):
+        self.running = self.workers
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.run, name="{}-{}".format(self.name, i + 1))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            if item is DONE:
+                # leave it for the other workers of the stage
+                self.inbox.put(DONE)
+                break
+            with self.lock:
+                self.received += 1
+            self.busy.inc()
+            try:
+                self.handler(item, self.emit)
+            except Exception as e:
+                print ("{} stage error : {}".format(self.name, e))
+            finally:
+                self.busy.dec()
+
+        with self.lock:
+            self.running -= 1
+            last = self.running == 0
+        if last and self.outbox is not None:
+            self.outbox.put(DONE)
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def report(self, started):
+        first = "-"
+        if self.first_emit is not None:
+            first = "{:.1f}s".format(self.first_emit - started)
+        print ("{:6} : {} workers, {} in, {} out, first out after {}".format(
+            self.name, self.workers, self.received, self.emitted, first))
+
+
+class LinkWriter(object):
+    # file for crawl_yelp, each written line goes to the biz stage
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.buffer = ''
+
+    def write(self, text):
+        self.buffer += text
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            if line:
+                self.emit({'url': line})
+
+    def flush(self):
+        pass
+
+
+def to_record(business):
+    return dict(zip(RECORD_KEYS, business))
+
+
+def from_record(record):
+    return [record.get(key, '') for key in RECORD_KEYS]
+
+
+def search_stage(params, item, emit):
+    # crawl a (city, category) search, the links go out page by page
+    city, category = item
+    search_params = dict(params)
+    search_params['searches'] = [(city, category)]
+    search_params['output'] = LinkWriter(emit)
+    yelpsearch.search_worker(search_params)
+
+
+def stage_trace(item, last=False):
+    # trace of the business of the item, NULL when it is not traced in this process
+    with traces_lock:
+        if last:
+            return traces.pop(item.get('yelp_url'), tracing.NULL)
+        return traces.get(item.get('yelp_url'), tracing.NULL)
+
+
+def biz_stage(fetch, seen, parsers, item, emit):
+    # fetch a business page and pass on the business when its rating is low enough
+    page_url = item['url']
+    if not seen.add(page_url):
+        return
+
+    trace = tracing.begin(page_url)
+    start = time.time()
+    with trace.span('fetch'):
+        page_source = fetch(page_url)
+    metrics.histogram('fetch_seconds', page='biz').observe(time.time() - start)
+    if page_source is None:
+        metrics.counter('pages_failed_total', page='biz').inc()
+        trace.finish('failed')
+        return
+    metrics.counter('pages_fetched_total', page='biz').inc()
+
+    rating = biz_parser.get_rating(page_source)
+    if rating is None or rating > yelp_proc.RATING_THRESHOLD:
+        metrics.counter('pages_rejected_total', reason='no_rating' if rating is None else 'rating').inc()
+        trace.finish('no_rating' if rating is None else 'rejected', rating=rating)
+        return
+
+    start = time.time()
+    with trace.span('parse'):
+        business = parsers.run(biz_parser.extract_business, page_source, page_url, rating)
+    metrics.histogram('parse_seconds', page='biz').observe(time.time() - start)
+
+    record = to_record(business)
+    if trace:
+        trace.set(rating=rating)
+        if record['website_url']:
+            trace.set(domain=registered_domain(record['website_url']))
+        with traces_lock:
+            traces[record['yelp_url']] = trace
+    emit(record)
+
+
+def email_stage(crawler, item, emit):
+    # crawl the website of the business for its email addresses
+    emails = []
+    if item.get('website_url'):
+        try:
+            emails = crawler.submit(item['website_url'], trace=stage_trace(item)).result()
+        except Exception:
+            emails = []
+    item['emails'] = emails
+    emit(item)
+
+
+def output_stage(output, item, emit):
+    # a csv row per email, as yelp_proc.py writes them
+    yelp_proc.write_business(output, from_record(item), item.get('emails', []), None, stage_trace(item, True))
+    emit(item)
+
+
+def json_stage(output_file, lock, item, emit):
+    # pass the items on to the next command as json lines
+    stage_trace(item, True).finish('passed_on')
+    with lock:
+        try:
+            output_file.write(json.dumps(item) + '\n')
+            output_file.flush()
+        except BrokenPipeError:
+            # the next command is gone, stop as on ctrl-c
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+    emit(item)
+
+
+def read_items(input_file):
+    # json lines of an earlier command, plain lines are taken as biz urls
+    for line in input_file:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = {'url': line}
+        yield item
+
+
+def feed(items, outbox):
+    for item in items:
+        outbox.put(item)
+    outbox.put(DONE)
+
+
+def parse_stages(text):
+    # the stages to run, in pipeline order and without gaps
+    names = [name.strip() for name in text.split(',') if name.strip()]
+    if len(names) == 0:
+        return None
+    for name in names:
+        if name not in STAGES:
+            return None
+    start = STAGES.index(names[0])
+    if names != STAGES[start:start + len(names)]:
+        return None
+    return names
+
+
+def get_workers(value, default):
+    if value and value > 0:
+        return value
+    return default
+
+
+def parse_argument():
+    """
+    Command(all stages) : python pipeline.py -s categories.txt -l city.txt -o output.csv -p 10 -v
+    Command(chained) : python pipeline.py --stages search -s categories.txt -l city.txt | python pipeline.py --stages biz,email,output -o output.csv
+    """
+
+    parser = argparse.ArgumentParser(description='search -> business page -> website emails -> csv, all stages at once')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help='stages to run, a part of search,biz,email,output. '
+                             'the first reads json lines from -i or stdin unless it is search, '
+                             'the last writes json lines to stdout unless it is output. default: all')
+    parser.add_argument('-s', '--search', help='categories file name, search stage')
+    parser.add_argument('-l', '--loc', help='city file name, search stage')
+    parser.add_argument('-p', '--pages', type=int, default=10, help='search pages per search. default: 10')
+    parser.add_argument('--seen', help='file of the links found so far by the search stage, kept across runs')
+    parser.add_argument('-i', '--input', help='json lines or biz urls for the first stage. default: stdin')
+    parser.add_argument('-o', '--output', help='output file name, output stage')
+    parser.add_argument('--sink', choices=SINKS, default='csv',
+                        help='output format: csv, sqlite or parquet(needs pyarrow). default: csv')
+    parser.add_argument('--search-workers', type=int, help='parallel searches, a browser each. default: 1')
+    parser.add_argument('--biz-workers', type=int, help='parallel business pages. default: 4')
+    parser.add_argument('--email-workers', type=int, help='websites crawled at once. default: 8')
+    parser.add_argument('--email-pages', type=int, help='pages of one website fetched at once. default: 4')
+    parser.add_argument('--parsers', type=int, default=0, help='processes parsing the search, business and website pages, 0 parses in the stage workers. default: 0')
+    parser.add_argument('--queue-size', type=int, default=100, help='items waiting between two stages. default: 100')
+    parser.add_argument('-r', '--rate', type=float, default=0.5, help='requests per second to yelp.com of all stages. default: 0.5')
+    parser.add_argument('--adaptive', action='store_true', help='raise the yelp.com rate while pages come back fine, cut it on block pages, 429/503 and timeouts')
+    parser.add_argument('--min-rate', type=float, help='lowest yelp.com rate of --adaptive. default: rate / 10')
+    parser.add_argument('--max-rate', type=float, help='highest yelp.com rate of --adaptive. default: rate * 4')
+    parser.add_argument('--site-rate', type=float, default=2.0, help='requests per second to a business website. default: 2')
+    parser.add_argument('-f', '--fetch', choices=['browser', 'hybrid'], default='hybrid',
+                        help='business pages in a browser, or plain http first. default: hybrid')
+    parser.add_argument('--lean', action='store_true', help='browsers skip images, fonts, css and trackers')
+    parser.add_argument('-tb', '--throttleb', default="2-5", help='wait between the searches of a worker in seconds. default: 2-5')
+    parser.add_argument('-b', '--banned', type=int, default=900, help='waiting time in seconds when banned. default: 900')
+    parser.add_argument('--spamtraps', default='spamtraps.txt', help='spamtrap patterns file. default: spamtraps.txt')
+    parser.add_argument('--email-cache', help='file of the emails found per website, kept across runs')
+    parser.add_argument('--stats', type=int, default=60, help='seconds between the stats lines, 0 for none. default: 60')
+    parser.add_argument('--metrics-port', type=int, help='serve the metrics as prometheus text on 127.0.0.1:<port>/metrics')
+    parser.add_argument('--trace', help='json lines file of the timed spans of each business from the biz stage on, see trace_summary.py')
+    parser.add_argument('-v', '--verbose', action='store_true', help='verbose mode')
+    parser.add_argument('-d', '--debug', action='store_true', help='debug mode')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_argument()
+
+    stages = parse_stages(args.stages)
+    if stages is None:
+        print ("stages must be a part of", ','.join(STAGES))
+        sys.exit(0)
+    if stages[0] == 'search' and (args.search is None or args.loc is None):
+        print ("search stage needs the categories(-s) and city(-l) files!")
+        sys.exit(0)
+    if stages[-1] == 'output' and args.output is None:
+        print ("output stage needs the output(-o) file!")
+        sys.exit(0)
+
+    # stdout carries the json lines, the messages go to stderr
+    data_out = sys.stdout
+    if stages[-1] != 'output':
+        sys.stdout = sys.stderr
+
+    tb = [2, 5]
+    throttleb = args.throttleb.split('-')
+    if len(throttleb) == 2 and 0 < int(throttleb[0]) < int(throttleb[1]):
+        tb = [int(throttleb[0]), int(throttleb[1])]
+
+    # the parser processes are started before the threads of the script, shared by the stages
+    parsers = ParsePool(max(0, args.parsers))
+    parsers.start()
+
+    # one budget for yelp.com, shared by the search and the biz stage
+    adaptive = None
+    if args.adaptive:
+        adaptive = (args.min_rate or args.rate / 10.0, args.max_rate or args.rate * 4)
+    limiter = RateLimiter(args.rate, args.site_rate, adaptive=adaptive)
+    http_client.configure(limiter=limiter)
+    yelp_proc.spamtraps = SpamtrapMatcher(args.spamtraps)
+
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    handlers = {}
+    workers = {}
+    pools = []
+    crawler = None
+    output = None
+    seen = None
+
+    if 'search' in stages:
+        workers['search'] = get_workers(args.search_workers, 1)
+        search_browsers = BrowserPool(partial(yelpsearch.get_driver, args.debug, args.lean), workers['search'])
+        pools.append(search_browsers)
+        seen = FingerprintSet(args.seen)
+        search_params = {
+            "browsers": search_browsers,
+            "limiter": limiter,
+            "journal": None,
+            "seen": seen,
+            "parsers": parsers,
+            "pages": args.pages,
+            "tb": tb,
+            "banned": args.banned,
+            "verbose": args.verbose
+        }
+        handlers['search'] = partial(search_stage, search_params)
+
+    if 'biz' in stages:
+        workers['biz'] = get_workers(args.biz_workers, 4)
+        biz_browsers = BrowserPool(partial(yelp_proc.get_driver, args.debug, args.lean), workers['biz'])
+        pools.append(biz_browsers)
+        fetch = partial(yelp_proc.load_page, biz_browsers, limiter=limiter)
+        if args.fetch == 'hybrid':
+            fetch = HybridFetcher(fetch)
+        handlers['biz'] = partial(biz_stage, fetch, FingerprintSet(), parsers)
+
+    if 'email' in stages:
+        workers['email'] = get_workers(args.email_workers, 8)
+        crawler = yelp_proc.EmailCrawler(workers['email'], get_workers(args.email_pages, 4),
+                                         DomainEmailCache(args.email_cache), parsers)
+        handlers['email'] = partial(email_stage, crawler)
+
+    if 'output' in stages:
+        workers['output'] = 1
+        output = OutputWriter(open_sink(args.sink, args.output, yelp_proc.OUTPUT_FIELDS))
+        handlers['output'] = partial(output_stage, output)
+    else:
+        stages = stages + ['json']
+        workers['json'] = 1
+        handlers['json'] = partial(json_stage, data_out, threading.Lock())
+
+    # first queue is fed by the searches or the input lines
+    if stages[0] == 'search':
+        categories, cities = yelpsearch.ready_categories_cities(args.search, args.loc)
+        items = [(city, category) for city in cities for category in categories]
+    elif args.input:
+        items = read_items(open(args.input, 'r', encoding='utf-8'))
+    else:
+        items = read_items(sys.stdin)
+
+    # stats line and metrics endpoint for the run
+    metrics.start(args.stats, args.metrics_port)
+    if args.trace:
+        tracing.configure(args.trace)
+
+    started = time.time()
+    inbox = queue.Queue(args.queue_size)
+    feeder = threading.Thread(target=feed, args=(items, inbox))
+    feeder.daemon = True
+    feeder.start()
+
+    running = []
+    for i, name in enumerate(stages):
+        outbox = None
+        if i < len(stages) - 1:
+            outbox = queue.Queue(args.queue_size)
+        stage = Stage(name, handlers[name], workers[name], inbox, outbox)
+        stage.start()
+        running.append(stage)
+        inbox = outbox
+
+    try:
+        for stage in running:
+            stage.join()
+    except ProgramKilled:
+        print ("Exit script...")
+    finally:
+        for pool in pools:
+            pool.shutdown()
+        if crawler is not None:
+            crawler.shutdown(wait=False)
+        parsers.shutdown(wait=False)
+        if output is not None:
+            output.close()
+        if seen is not None:
+            seen.close()
+        metrics.stop()
+        tracing.close()
+
+    print ("Elapsed time : {:.1f}s".format(time.time() - started))
+    for stage in running:
+        stage.report(started)
+    limiter.report()
+    metrics.report()
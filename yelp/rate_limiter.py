@@ -0,0 +1,218 @@
+import asyncio
+import threading
+import time
+from urllib.parse import urlparse
+
+import metrics
+
+# script of the page yelp serves instead of the content when it blocks a client
+BLOCK_PAGE_MARKER = '/error-pages/block.js'
+
+
+def is_block_page(page):
+    # page is the text or the raw bytes of a response
+    marker = BLOCK_PAGE_MARKER
+    if isinstance(page, bytes):
+        marker = marker.encode('ascii')
+    return marker in page
+
+
+class TokenBucket(object):
+    """
+    Token bucket shared by all workers.
+    Tokens refill at `rate` per second up to `burst`.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take one token and return the seconds to wait before it may be used.
+        When the bucket is empty the token is borrowed from the future, so
+        waiting workers are served in the order they asked.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def set_rate(self, rate):
+        # tokens up to now are refilled at the old rate
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.rate = float(rate)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AdaptiveRate(object):
+    """
+    AIMD control of a token bucket shared by all workers.
+    Each healthy response raises the rate by `increase` up to max_rate, a block page,
+    a 429/503 or a timeout multiplies it by `decrease` down to min_rate. The rate is cut
+    at most once per `cooldown` seconds, so workers hitting the same block cut it once.
+    """
+
+    def __init__(self, bucket, min_rate, max_rate, increase, decrease=0.5, cooldown=5.0, ban_wait=60):
+        self.bucket = bucket
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = float(increase)
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.ban_wait = ban_wait
+        self.lock = threading.Lock()
+        self.last_cut = 0.0
+        # failures since the last healthy response
+        self.failures = 0
+        self.cuts = 0
+        self.events = {}
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            rate = min(self.max_rate, self.bucket.rate + self.increase)
+            if rate != self.bucket.rate:
+                self.bucket.set_rate(rate)
+
+    def failure(self, reason):
+        with self.lock:
+            self.failures += 1
+            self.events[reason] = self.events.get(reason, 0) + 1
+            now = time.monotonic()
+            if now - self.last_cut < self.cooldown:
+                return
+            self.last_cut = now
+            old = self.bucket.rate
+            rate = max(self.min_rate, old * self.decrease)
+            self.bucket.set_rate(rate)
+            self.cuts += 1
+        print ("yelp.com rate {:.3f} -> {:.3f} requests/s ({})".format(old, rate, reason))
+
+    def backoff(self, longest):
+        # seconds to wait after a ban, doubled for each failure in a row
+        with self.lock:
+            return min(longest, self.ban_wait * 2 ** max(0, self.failures - 1))
+
+
+class RateLimiter(object):
+    """
+    Per-host token buckets: one bucket for yelp.com and one per business domain
+    """
+
+    def __init__(self, yelp_rate, site_rate, burst=1, adaptive=None):
+        # adaptive: (min_rate, max_rate), the yelp.com rate then follows the responses
+        self.yelp_rate = yelp_rate
+        self.site_rate = site_rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+        self.control = None
+        if adaptive is not None:
+            min_rate, max_rate = adaptive
+            self.control = AdaptiveRate(self.bucket('https://www.yelp.com/'), min_rate, max_rate, yelp_rate / 20.0)
+            metrics.gauge('rate_per_second', self.current_rate, host='yelp')
+
+    def host_key(self, url):
+        host = urlparse(url).netloc.lower()
+        if host == 'yelp.com' or host.endswith('.yelp.com'):
+            return 'yelp.com'
+        return host
+
+    def bucket(self, url):
+        host = self.host_key(url)
+        if host == 'yelp.com':
+            rate = self.yelp_rate
+        else:
+            rate = self.site_rate
+
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(rate, self.burst)
+                self.buckets[host] = bucket
+            return bucket
+
+    def acquire(self, url):
+        # block until the host of the url has budget for one more request
+        start = time.time()
+        self.bucket(url).acquire()
+        self.waited(url, time.time() - start)
+
+    async def acquire_async(self, url):
+        start = time.time()
+        await self.bucket(url).acquire_async()
+        self.waited(url, time.time() - start)
+
+    def waited(self, url, seconds):
+        host = 'yelp' if self.host_key(url) == 'yelp.com' else 'site'
+        metrics.histogram('rate_wait_seconds', host=host).observe(seconds)
+
+    def feedback(self, url, status=200, page=None, blocked=False, timed_out=False):
+        """
+        Tell the adaptive yelp.com rate how a request went. A timeout, a 429/503 or
+        the block page(page is the text or the raw bytes) cuts it, anything else raises it.
+        The failures are counted as bans with or without the adaptive rate.
+        """
+        if self.host_key(url) != 'yelp.com':
+            return
+
+        reason = None
+        if timed_out:
+            reason = 'timeout'
+        elif status in (429, 503):
+            reason = 'status {}'.format(status)
+        elif blocked:
+            reason = 'block page'
+        elif page is not None and is_block_page(page):
+            reason = 'block page'
+
+        if reason is not None:
+            metrics.counter('bans_total', reason=reason.replace(' ', '_')).inc()
+        if self.control is None:
+            return
+
+        if reason is None:
+            self.control.success()
+        else:
+            self.control.failure(reason)
+
+    def ban_wait(self, longest):
+        # seconds to wait after a ban, `longest` without the adaptive rate
+        if self.control is None:
+            return longest
+        return self.control.backoff(longest)
+
+    def current_rate(self, url='https://www.yelp.com/'):
+        return self.bucket(url).rate
+
+    def report(self):
+        if self.control is None:
+            return
+        events = ", ".join("{} {}".format(count, reason) for reason, count in sorted(self.control.events.items()))
+        print ("yelp.com rate : {:.3f} requests/s, cut {} times({})".format(
+            self.control.rate, self.control.cuts, events or "no failures"))
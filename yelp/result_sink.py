@@ -0,0 +1,159 @@
+import csv
+import os
+import sqlite3
+
+from domain_cache import registered_domain
+
+# optional, needed for the parquet sink
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+SINKS = ['csv', 'sqlite', 'parquet']
+
+# columns of the business rows, in the order of yelp_proc.OUTPUT_FIELDS
+COLUMNS = ['business_name', 'category', 'rating', 'price_range', 'phone', 'address',
+           'email', 'claimed', 'reviews', 'website_url', 'yelp_url']
+
+
+class LineSink(object):
+    # a line of text per row, close_file: the sink closes the file
+
+    def __init__(self, output_file, close_file=False):
+        self.output_file = output_file
+        self.close_file = close_file
+
+    def write_rows(self, rows):
+        self.output_file.write(''.join(row + '\n' for row in rows))
+
+    def flush(self):
+        self.output_file.flush()
+
+    def sync(self):
+        os.fsync(self.output_file.fileno())
+
+    def close(self):
+        if self.close_file:
+            self.output_file.close()
+
+
+class CsvSink(LineSink):
+    # csv rows, the header goes first into an empty file
+
+    def __init__(self, output_file, header=None, close_file=False):
+        LineSink.__init__(self, output_file, close_file)
+        self.writer = csv.writer(output_file)
+        if header is not None and output_file.tell() == 0:
+            self.writer.writerow(header)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+
+class SqliteSink(object):
+    """
+    Business rows in a sqlite database: a row per business and a row per email,
+    indexed on the yelp url, the website domain and the email.
+    Each batch is inserted in one transaction.
+    """
+
+    def __init__(self, path):
+        # used from the writer thread only
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.execute("""CREATE TABLE IF NOT EXISTS business (
+                yelp_url TEXT PRIMARY KEY,
+                business_name TEXT, category TEXT, rating REAL, price_range TEXT,
+                phone TEXT, address TEXT, claimed INTEGER, reviews TEXT,
+                website_url TEXT, website_domain TEXT)""")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS email (
+                yelp_url TEXT NOT NULL, email TEXT NOT NULL,
+                PRIMARY KEY (yelp_url, email))""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS business_domain ON business (website_domain)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS email_email ON email (email)")
+
+    def write_rows(self, rows):
+        businesses = []
+        emails = []
+        for row in rows:
+            record = dict(zip(COLUMNS, row))
+            domain = registered_domain(record['website_url']) if record['website_url'] else ''
+            businesses.append((record['yelp_url'], record['business_name'], record['category'],
+                               record['rating'], record['price_range'], record['phone'], record['address'],
+                               int(bool(record['claimed'])), record['reviews'], record['website_url'], domain))
+            if record['email']:
+                emails.append((record['yelp_url'], record['email']))
+
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO business VALUES (?,?,?,?,?,?,?,?,?,?,?)", businesses)
+            self.db.executemany("INSERT OR IGNORE INTO email VALUES (?,?)", emails)
+
+    def flush(self):
+        # committed with each batch
+        pass
+
+    def sync(self):
+        # a full checkpoint of the write ahead log into the database file
+        self.db.execute("PRAGMA wal_checkpoint(FULL)")
+
+    def close(self):
+        self.db.close()
+
+
+class ParquetSink(object):
+    """
+    Business rows in a parquet file, a row group per batch.
+    Needs pyarrow. The file is written anew and readable once the sink is closed.
+    """
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise ImportError("the parquet sink needs pyarrow: pip install pyarrow")
+        self.schema = pyarrow.schema([
+            ('business_name', pyarrow.string()), ('category', pyarrow.string()),
+            ('rating', pyarrow.float64()), ('price_range', pyarrow.string()),
+            ('phone', pyarrow.string()), ('address', pyarrow.string()),
+            ('email', pyarrow.string()), ('claimed', pyarrow.bool_()),
+            ('reviews', pyarrow.string()), ('website_url', pyarrow.string()),
+            ('yelp_url', pyarrow.string()), ('website_domain', pyarrow.string()),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='snappy')
+
+    def write_rows(self, rows):
+        columns = [[] for name in self.schema.names]
+        for row in rows:
+            values = list(row)
+            values[2] = float(values[2]) if values[2] not in ('', None) else None
+            values[7] = bool(values[7])
+            values.append(registered_domain(values[9]) if values[9] else '')
+            for i, value in enumerate(values):
+                columns[i].append(value)
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema))
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        self.writer.close()
+
+
+def open_sink(kind, path, header=None, append=False):
+    """
+    Open the sink of the given kind on path. header is the csv header,
+    append keeps the rows of a csv file. A database is always added to.
+    """
+    if kind == 'sqlite':
+        return SqliteSink(path)
+    if kind == 'parquet':
+        return ParquetSink(path)
+    output_file = open(path, "a" if append else "w", encoding='utf-8', newline='')
+    return CsvSink(output_file, header, close_file=True)
@@ -0,0 +1,70 @@
+import queue
+import threading
+import time
+
+import metrics
+
+
+class JobQueue(object):
+    """
+    Shared queue of urls. A worker pulls the next url as soon as it is done
+    with the previous one, so a slow url only holds up its own worker.
+    """
+
+    def __init__(self, items):
+        self.queue = queue.Queue()
+        for item in items:
+            self.queue.put(item)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.started = time.time()
+
+        # progress and queue depth for the stats line
+        self.done = metrics.counter('jobs_done_total')
+        self.busy = metrics.gauge('workers_busy')
+        self.busy_seconds = metrics.counter('worker_busy_seconds_total')
+        metrics.gauge('jobs').set(self.queue.qsize())
+        metrics.gauge('queue_depth', self.queue.qsize, queue='jobs')
+        metrics.progress(self.queue.qsize(), self.done)
+
+    def jobs(self, worker):
+        """
+        Yield urls for the worker until the queue is drained.
+        The time between taking a url and asking for the next one counts as busy time.
+        """
+        with self.lock:
+            stats = self.stats.setdefault(worker, {"jobs": 0, "busy": 0.0})
+        workers = metrics.gauge('workers')
+        workers.inc()
+
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                workers.dec()
+                return
+
+            start = time.time()
+            self.busy.inc()
+            try:
+                yield item
+            finally:
+                busy = time.time() - start
+                with self.lock:
+                    stats["jobs"] += 1
+                    stats["busy"] += busy
+                self.busy.dec()
+                self.busy_seconds.inc(busy)
+                self.done.inc()
+
+    def report(self, unit="urls"):
+        # print jobs, busy time and utilisation of each worker
+
+        elapsed = time.time() - self.started
+        print ("Elapsed time : {:.1f}s".format(elapsed))
+        with self.lock:
+            for worker in sorted(self.stats):
+                stats = self.stats[worker]
+                utilisation = stats["busy"] / elapsed * 100 if elapsed > 0 else 0.0
+                print ("{} : {} {}, busy {:.1f}s, utilisation {:.1f}%".format(
+                    worker, stats["jobs"], unit, stats["busy"], utilisation))
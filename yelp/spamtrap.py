@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class Automaton(object):
+    """
+    Aho-Corasick automaton over the lowercased spamtraps.
+    A search is linear in the length of the address, whatever the number of spamtraps.
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [False]
+
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(False)
+                state = next_state
+            self.out[state] = True
+
+        # breadth first, so the fail state of a node is done before the node
+        todo = deque(self.goto[0].values())
+        while todo:
+            state = todo.popleft()
+            for char, next_state in self.goto[state].items():
+                todo.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                if self.out[self.fail[next_state]]:
+                    self.out[next_state] = True
+
+    def search(self, text):
+        # True when any pattern is a substring of text
+
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                return True
+        return False
+
+
+class SpamtrapMatcher(object):
+    """
+    Spamtraps of a text file, one per line, compiled into an automaton.
+    The file is reloaded when it changes, checked at most every reload_interval seconds.
+    """
+
+    def __init__(self, path, reload_interval=60):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.checked = 0.0
+        self.automaton = None
+        self.count = 0
+        self.load()
+
+    def load(self):
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, "r", encoding='utf-8') as search_f:
+            patterns = {line.strip().lower() for line in search_f.readlines()}
+        patterns.discard('')
+
+        # the new automaton is built aside and swapped in, readers never wait for it
+        automaton = Automaton(patterns)
+        self.automaton = automaton
+        self.count = len(patterns)
+        self.mtime = mtime
+        self.checked = time.time()
+
+    def maybe_reload(self):
+        now = time.time()
+        if now - self.checked < self.reload_interval:
+            return
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            self.checked = now
+            try:
+                if os.path.getmtime(self.path) != self.mtime:
+                    self.load()
+                    print ("Reloaded {} spamtraps from {}".format(self.count, self.path))
+            except (IOError, OSError) as e:
+                print ("Could not reload spamtraps :", e)
+        finally:
+            self.lock.release()
+
+    def match(self, address):
+        # True when the address contains a spamtrap
+
+        if self.reload_interval:
+            self.maybe_reload()
+        return self.automaton.search(address.lower())
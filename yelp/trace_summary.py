@@ -0,0 +1,156 @@
+"""
+Summary of trace files(--trace): the time of each stage, the slowest domains and the slowest businesses.
+A stage is the path of a span in its business, e.g. email_crawl/page/fetch.
+
+Command : python trace_summary.py trace.jsonl
+Command : python trace_summary.py trace-1.jsonl trace-2.jsonl -n 20 --status written
+"""
+import argparse
+import json
+import sys
+from collections import OrderedDict
+
+
+def read_traces(paths):
+    # the records of the trace files, a partly written last line is skipped
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def walk(spans, prefix=''):
+    # (path, span) of the spans and their children
+    for span in spans:
+        path = prefix + span.get('name', '?')
+        yield path, span
+        for item in walk(span.get('spans', []), path + '/'):
+            yield item
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class StageStats(object):
+    # seconds and errors of the spans of one path
+
+    def __init__(self):
+        self.seconds = []
+        self.errors = 0
+
+    def add(self, span):
+        if 'seconds' in span:
+            self.seconds.append(span['seconds'])
+        if 'error' in span:
+            self.errors += 1
+
+
+class DomainStats(object):
+    # businesses of a website domain and the time of their crawls
+
+    def __init__(self):
+        self.businesses = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+        self.crawl = 0.0
+        self.pages = 0
+        self.errors = 0
+
+    def add(self, record, paths):
+        self.businesses += 1
+        self.seconds += record.get('seconds', 0.0)
+        self.slowest = max(self.slowest, record.get('seconds', 0.0))
+        for path, span in paths:
+            if path == 'email_crawl':
+                self.crawl += span.get('seconds', 0.0)
+            elif path == 'email_crawl/page':
+                self.pages += 1
+                if 'error' in span or any('error' in child for child in span.get('spans', [])):
+                    self.errors += 1
+
+
+def summarize(records, top):
+    statuses = OrderedDict()
+    stages = OrderedDict()
+    domains = {}
+    slowest = []
+    total = 0.0
+
+    for record in records:
+        status = record.get('status', '?')
+        statuses[status] = statuses.get(status, 0) + 1
+        total += record.get('seconds', 0.0)
+
+        paths = list(walk(record.get('spans', [])))
+        for path, span in paths:
+            stages.setdefault(path, StageStats()).add(span)
+
+        domain = record.get('domain')
+        if domain:
+            domains.setdefault(domain, DomainStats()).add(record, paths)
+
+        # the slowest span on the top level tells where the business spent its time
+        top_spans = [span for span in record.get('spans', []) if 'seconds' in span]
+        stage = max(top_spans, key=lambda span: span['seconds'])['name'] if top_spans else '-'
+        slowest.append((record.get('seconds', 0.0), record.get('url', '?'), domain or '-', stage))
+
+    count = sum(statuses.values())
+    if count == 0:
+        print ("No traces.")
+        return
+
+    print ("Businesses : {}, {}".format(count, ", ".join("{} {}".format(n, status) for status, n in statuses.items())))
+    print ("Business time : {:.1f}s in all, {:.2f}s mean".format(total, total / count))
+
+    print ("")
+    print ("Stages(seconds per span, share of the business time) :")
+    print ("{:32} {:>7} {:>9} {:>7} {:>8} {:>8} {:>8} {:>8} {:>7}".format(
+        "stage", "spans", "total", "share", "mean", "p50", "p90", "max", "errors"))
+    for path, stats in stages.items():
+        seconds = sorted(stats.seconds)
+        if not seconds:
+            continue
+        stage_total = sum(seconds)
+        print ("{:32} {:>7} {:>9.1f} {:>6.1f}% {:>8.3f} {:>8.3f} {:>8.3f} {:>8.3f} {:>7}".format(
+            path, len(seconds), stage_total, stage_total / total * 100 if total > 0 else 0.0,
+            stage_total / len(seconds), percentile(seconds, 0.5), percentile(seconds, 0.9), seconds[-1], stats.errors))
+
+    if domains:
+        print ("")
+        print ("Slowest domains(by business time) :")
+        print ("{:40} {:>10} {:>9} {:>8} {:>9} {:>7} {:>11}".format(
+            "domain", "businesses", "total", "max", "crawl", "pages", "page errors"))
+        ranked = sorted(domains.items(), key=lambda item: item[1].seconds, reverse=True)
+        for domain, stats in ranked[:top]:
+            print ("{:40} {:>10} {:>9.1f} {:>8.1f} {:>9.1f} {:>7} {:>11}".format(
+                domain[:40], stats.businesses, stats.seconds, stats.slowest, stats.crawl, stats.pages, stats.errors))
+
+    print ("")
+    print ("Slowest businesses :")
+    for seconds, url, domain, stage in sorted(slowest, reverse=True)[:top]:
+        print ("{:>9.2f}s  {}  {}  mostly {}".format(seconds, url, domain, stage))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Summarize the trace files written with --trace')
+    parser.add_argument('traces', nargs='+', help='trace files(json lines)')
+    parser.add_argument('-n', '--top', type=int, default=10, help='domains and businesses listed. default: 10')
+    parser.add_argument('--status', help='only the businesses of this status, e.g. written, rejected, failed')
+    args = parser.parse_args()
+
+    records = read_traces(args.traces)
+    if args.status:
+        records = (record for record in records if record.get('status') == args.status)
+    try:
+        summarize(records, args.top)
+    except IOError as e:
+        print ("Could not read the trace file :", e)
+        sys.exit(-1)
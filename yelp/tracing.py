@@ -0,0 +1,178 @@
+"""
+Timed spans of each business, written as a json line per business when tracing is on(configure).
+A business gets a root span(begin) and nested spans for the fetch, the chrome load and wait,
+the parse, the email crawl and each of its pages, and the output write. Spans opened with `with`
+are the parent of the spans opened below them in the same thread(span), the spans of other
+threads are opened on their parent explicitly. Summarised by trace_summary.py.
+
+    {"url": "https://www.yelp.com/biz/...", "start": 1571234567.12, "seconds": 4.21, "status": "written",
+     "domain": "example.com", "spans": [{"name": "fetch", "start": 0.0, "seconds": 2.3, "spans": [...]}, ...]}
+"""
+import json
+import threading
+import time
+
+
+# spans opened with `with`, per thread
+local = threading.local()
+
+lock = threading.Lock()
+trace_file = None
+
+
+def stack():
+    spans = getattr(local, 'spans', None)
+    if spans is None:
+        spans = local.spans = []
+    return spans
+
+
+class NullSpan(object):
+    # span of a run without tracing, does nothing
+
+    def __bool__(self):
+        return False
+
+    def span(self, name, **attrs):
+        return self
+
+    def set(self, **attrs):
+        pass
+
+    def close(self):
+        pass
+
+    def finish(self, status, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL = NullSpan()
+
+
+class Span(object):
+    """
+    Named, timed part of the work of a business, with attributes and child spans.
+    Started when created, ended by close or at the end of its `with` block, where
+    an exception is recorded as its error.
+    """
+
+    def __init__(self, name, root=None, **attrs):
+        self.name = name
+        self.root = root if root is not None else self
+        self.started = time.time()
+        self.seconds = None
+        self.attrs = attrs
+        self.spans = []
+
+    def span(self, name, **attrs):
+        child = Span(name, self.root, **attrs)
+        with self.root.lock:
+            self.spans.append(child)
+        return child
+
+    def set(self, **attrs):
+        with self.root.lock:
+            self.attrs.update(attrs)
+
+    def close(self):
+        if self.seconds is None:
+            self.seconds = time.time() - self.started
+
+    def __enter__(self):
+        stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.set(error=repr(exc))
+        self.close()
+        spans = stack()
+        if spans and spans[-1] is self:
+            spans.pop()
+        return False
+
+    def to_dict(self, origin):
+        with self.root.lock:
+            attrs = dict(self.attrs)
+            spans = list(self.spans)
+        record = {"name": self.name, "start": round(self.started - origin, 4)}
+        if self.seconds is not None:
+            record["seconds"] = round(self.seconds, 4)
+        record.update(attrs)
+        if spans:
+            record["spans"] = [span.to_dict(origin) for span in spans]
+        return record
+
+
+class Trace(Span):
+    # root span of a business, written to the trace file by finish
+
+    def __init__(self, url):
+        self.lock = threading.Lock()
+        Span.__init__(self, 'business')
+        self.url = url
+        self.finished = False
+
+    def finish(self, status, **attrs):
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+            self.attrs.update(attrs)
+        self.close()
+
+        record = {"url": self.url, "start": round(self.started, 3), "seconds": round(self.seconds, 4), "status": status}
+        for key, value in self.to_dict(self.started).items():
+            if key not in ('name', 'start', 'seconds'):
+                record[key] = value
+        write(record)
+
+
+def configure(path):
+    # trace the businesses into the json lines file, added to when it exists
+    global trace_file
+
+    with lock:
+        trace_file = open(path, 'a', encoding='utf-8')
+
+
+def begin(url):
+    """
+    Root span of the business of the url, NULL when tracing is off.
+    """
+    if trace_file is None:
+        return NULL
+    return Trace(url)
+
+
+def span(name, **attrs):
+    """
+    Child span of the span opened last with `with` in this thread, NULL when there is none.
+    """
+    spans = getattr(local, 'spans', None)
+    if not spans:
+        return NULL
+    return spans[-1].span(name, **attrs)
+
+
+def write(record):
+    line = json.dumps(record) + '\n'
+    with lock:
+        if trace_file is not None:
+            trace_file.write(line)
+            trace_file.flush()
+
+
+def close():
+    global trace_file
+
+    with lock:
+        if trace_file is not None:
+            trace_file.close()
+            trace_file = None
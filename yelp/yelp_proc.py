@@ -1,34 +1,47 @@
 from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait # available since 2.4.0
 from selenium.webdriver.support import expected_conditions as EC # available since 2.26.0
 from selenium.common.exceptions import TimeoutException
-from selenium.common import exceptions as EX
-from multiprocessing.pool import ThreadPool, Pool
+from multiprocessing.pool import ThreadPool
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import deque
+from functools import partial
 import sys
 import threading
 import argparse
 import time
 import signal
-from bs4 import BeautifulSoup
 import random
-import json
-from urllib.parse import unquote
 from urllib.parse import urlparse
-from lxml import etree
-from lxml import html
-import csv
-import re
-from re import compile, IGNORECASE, findall
-import requests
+import http_client
+import metrics
+import tracing
+from http_cache import HttpCache
+import biz_parser
+from email_extract import is_valid, validate_batch, parse_site_page
+from scheduler import JobQueue
+from spamtrap import SpamtrapMatcher
+from domain_cache import DomainEmailCache, registered_domain, site_key
+from rate_limiter import RateLimiter, is_block_page
+from checkpoint import ProgressJournal
+from browser_pool import BrowserPool
+from output_writer import OutputWriter, FSYNC_POLICIES
+from result_sink import open_sink, SINKS
+from hybrid_fetch import HybridFetcher
+from parse_pool import ParsePool
+from biz_parser import extract_business
+from lean_browser import lean_options, block_urls, page_metrics, PageStats, LEAN_CAPABILITIES
 
 
 RATING_THRESHOLD = 4.5
 
-threadLocal = threading.local()
+# pages crawled per business website
+MAX_EMAIL_PAGES = 30
+
+# csv header of the output, in the order of the business rows
+OUTPUT_FIELDS = ['Business Name', 'Category', 'Yelp Rating', 'Price Range', 'Phone Number',
+                 'Address', 'Email', 'Claimed', 'Number of Reviews', 'Website URL', 'Yelp URL']
 
 
 class ProgramKilled(Exception):
@@ -43,303 +56,396 @@ def wait_for(min, max):
     time.sleep(random.uniform(min, max))
 
 
-def get_substring(instr, startstr, endstr=None):
+def load_page(browsers, page_url, limiter, cache=None, stats=None):
     """
-    Get sub string between the start and end string
+    Get the page source of the yelp page, None when it does not load.
+    With a cache, a cached page skips the browser and the rate limiter.
+    Bytes and load time of the page are added to stats.
     """
-    if startstr == "":
-        length = instr.find(endstr)
-        if length >= 0:
-            return instr[:length]
-
-    start_idx = instr.find(startstr)
-    if start_idx == -1:
-        return ""
-    start_idx += len(startstr)
-    if start_idx >= 0:
-        if endstr:
-            length = instr[start_idx:].find(endstr)
-            if length == -1:
-                return instr[start_idx:]
-            return instr[start_idx:start_idx+length]
-        return instr[start_idx:]
-
-
-def get_business_website_url(driver, params):
-
-    page_urls = params['urls']
-    throttle = params['throttle']
-    output_file = params['output']
-    verbose = params['verbose']
-
-    for page_url in page_urls:
+    if cache is not None:
+        cached = cache.get(page_url)
+        if cached is not None:
+            return cached.text
+
+    with browsers.lease() as browser:
+        driver = browser.driver
+        with tracing.span('rate_wait'):
+            limiter.acquire(page_url)
+        start = time.time()
         try:
-            driver.get(page_url)
+            with tracing.span('load'):
+                driver.get(page_url)
         except:
-            continue
+            return None
         try:
-            WebDriverWait(driver, 100).until(EC.presence_of_element_located((By.XPATH, '//div[contains(@class, "main-content-wrap")]')))
+            with tracing.span('wait'):
+                WebDriverWait(driver, 100).until(EC.presence_of_element_located((By.XPATH, '//div[contains(@class, "main-content-wrap")]')))
         except TimeoutException:
             print("* page_url: ",page_url)
-            continue
+            # the block page has no content to wait for
+            try:
+                blocked = is_block_page(driver.page_source)
+            except:
+                blocked = False
+            limiter.feedback(page_url, blocked=blocked, timed_out=not blocked)
+            return None
 
-        soup = BeautifulSoup(driver.page_source, 'lxml')
-        tree = etree.HTML(driver.page_source)
+        page_source = driver.page_source
+        metrics.histogram('browser_load_seconds').observe(time.time() - start)
+        limiter.feedback(page_url, page=page_source)
+        if stats is not None:
+            stats.add(page_metrics(driver), time.time() - start)
 
-        jsonItems = soup.findAll("script", {"type": "application/ld+json"})
-        if len(jsonItems) == 0:
-            wait_for(throttle - 0.5, throttle + 0.5)
-            continue
+    if cache is not None:
+        cache.put(page_url, 200, {'Content-Type': 'text/html; charset=utf-8'}, page_source.encode('utf-8'), 'utf-8')
+    return page_source
+
+
+def get_business_website_url(params):
 
-        bizItem = jsonItems[-1]
-        jsonTxt = bizItem.text.strip()
-        bizObj = json.loads(jsonTxt)
+    page_urls = params['urls']
+    fetch = params['fetch']
+    output = params['output']
+    crawler = params['crawler']
+    journal = params['journal']
+    parsers = params['parsers']
+    verbose = params['verbose']
+
+    for page_url in page_urls:
+        # spans of the business, when tracing
+        trace = tracing.begin(page_url)
+
+        start = time.time()
+        with trace.span('fetch'):
+            page_source = fetch(page_url)
+        metrics.histogram('fetch_seconds', page='biz').observe(time.time() - start)
+        if page_source is None:
+            metrics.counter('pages_failed_total', page='biz').inc()
+            trace.finish('failed')
+            continue
+        metrics.counter('pages_fetched_total', page='biz').inc()
 
-        ratingValue = 5.0
-        if 'aggregateRating' in bizObj:
-            if 'ratingValue' in bizObj['aggregateRating']:
-                ratingValue = float(bizObj['aggregateRating']['ratingValue'])
+        # the rating is read from the raw page, only kept pages are parsed
+        try:
+            ratingValue = biz_parser.get_rating(page_source)
+        except biz_parser.PAGE_ERRORS as e:
+            parse_failed(page_url, trace, e)
+            continue
+        if ratingValue is None:
+            metrics.counter('pages_rejected_total', reason='no_rating').inc()
+            trace.finish('no_rating')
+            continue
 
         if verbose == True:
             print("Rating Value :", ratingValue, page_url)
 
         if ratingValue > RATING_THRESHOLD:
-            wait_for(throttle - 0.5, throttle + 0.5)
+            metrics.counter('pages_rejected_total', reason='rating').inc()
+            trace.finish('rejected', rating=ratingValue)
+            if journal is not None:
+                journal.mark_done(page_url)
             continue
 
-        # parsing info
-        yelp_rating = ratingValue
-        business_name = soup.find('div', {'class': 'hidden'}).find(
-            'meta', {'itemprop': 'name'})['content']
-        price_range = soup.find('div', {'class': 'hidden'}).find(
-            'meta', {'itemprop': 'priceRange'})['content']
-        category = ', '.join(tree.xpath('//a[contains(@href, "/c/")]/text()'))
-
+        start = time.time()
         try:
-            phone = soup.find('span', {'itemprop': 'telephone'}).text.strip()
-        except:
-            phone = ''
+            with trace.span('parse'):
+                business = parsers.run(extract_business, page_source, page_url, ratingValue)
+        except biz_parser.PAGE_ERRORS as e:
+            parse_failed(page_url, trace, e)
+            continue
+        metrics.histogram('parse_seconds', page='biz').observe(time.time() - start)
+        website_url = business[9]
+        trace.set(rating=ratingValue)
+
+        if website_url != "":
+            # crawl the website in the background and go on with the next yelp page
+            print("Business website :", website_url)
+            trace.set(domain=registered_domain(website_url))
+            crawler.submit(website_url, partial(on_emails_found, output, journal, business, trace), trace)
+        else:
+            write_business(output, business, [], journal, trace)
 
-        address_ = []
-        try:
-            streetAddress = soup.find(
-                'span', {'itemprop': 'streetAddress'}).text.strip()
-        except:
-            streetAddress = ''
-        address_.append(streetAddress)
-        try:
-            addressLocality = soup.find(
-                'span', {'itemprop': 'addressLocality'}).text.strip()
-        except:
-            addressLocality = ''
-        address_.append(addressLocality)
 
-        try:
-            region = soup.find(
-                'span', {'itemprop': 'addressRegion'}).text.strip()
-        except:
-            region = ''
-        address_.append(region)
-        try:
-            postalCode = soup.find(
-                'span', {'itemprop': 'postalCode'}).text.strip()
-        except:
-            postalCode = ''
-        address_.append(postalCode)
-        address = ' '.join(address_).strip()
-        try:
-            reviews = soup.find(
-                'span', {'itemprop': 'reviewCount'}).text.strip()
-        except:
-            reviews = ''
-        claimed_tag = tree.xpath(
-            '//span[contains(@class, "checkmark-badged")]')
+def parse_failed(page_url, trace, error):
+    # a malformed page fails alone, the thread goes on with the next one
+    print ("Could not parse the page :", page_url, repr(error))
+    metrics.counter('pages_failed_total', page='biz').inc()
+    trace.finish('failed', error=repr(error))
 
-        if len(claimed_tag) > 0:
-            claimed = True
-        else:
-            claimed = False
 
-        website_url = ""
-        biz_website_link = soup.find('a', {'rel': 'noopener'})
+def on_emails_found(output, journal, business, trace, future):
+    # called by the email crawler when the website of the business is done
+
+    try:
+        emails = future.result()
+    except Exception:
         emails = []
-        if biz_website_link:
-            website_url = biz_website_link['href']
-            website_url = get_substring(website_url, "url=", "&website")
-            if website_url != "":
-                website_url = unquote(website_url)
-                print("Business website :", website_url)
-                emails = EmailScraper(website_url).extract_mail_add()
-                print('Found these email address(es) :', emails)
-
-        # write csv
-        if len(emails) > 0:
-            for e in emails:
-                my_data = [business_name, category, yelp_rating, price_range,
-                           phone, address, e, claimed, reviews, website_url, page_url]
-                writer = csv.writer(output_file)
-                writer.writerow(my_data)
-        else:
-            my_data = [business_name, category, yelp_rating, price_range,
-                        phone, address, '', claimed, reviews, website_url, page_url]
-            writer = csv.writer(output_file)
-            writer.writerow(my_data)            
+    print('Found these email address(es) :', emails)
+    write_business(output, business, emails, journal, trace)
+
+
+def write_business(output, business, emails, journal=None, trace=tracing.NULL):
+    # queue the csv rows, a row per email, the yelp url is journaled once they are on disk
 
-        wait_for(throttle - 0.5, throttle + 0.5)
+    trace.set(emails=len(emails))
+    if len(emails) == 0:
+        emails = ['']
+    rows = []
+    for e in emails:
+        my_data = list(business)
+        my_data[6] = e
+        rows.append(my_data)
 
+    on_written = None
+    if journal is not None or trace:
+        on_written = partial(business_written, journal, business[10], trace, trace.span('output_write', rows=len(rows)))
+    output.write(rows, on_written)
 
-def get_driver(debug):
 
-    driver = getattr(threadLocal, 'driver', None)
+def business_written(journal, page_url, trace, write_span):
+    # the rows of the business are on disk
+    write_span.close()
+    trace.finish('written')
+    if journal is not None:
+        journal.mark_done(page_url)
+
+
+def get_driver(debug, lean=False):
+    # launch a new browser, the browser pool keeps and reuses them
+    # lean: no images, fonts, css and trackers, eager page loads
 
     options = webdriver.ChromeOptions()
     options.add_experimental_option("excludeSwitches",["ignore-certificate-errors"])
     options.add_argument('--disable-gpu')
     options.add_argument('--headless')
 
-    if driver is None:
-        # driver = webdriver.Chrome("chromedriver.exe", chrome_options=options)
-        if debug:
-            driver = webdriver.Chrome()
-            driver.set_window_size(0, 0)
-        else:
-            driver = webdriver.Chrome(chrome_options=options)
-        setattr(threadLocal, 'driver', driver)
-        return driver
+    capabilities = None
+    if lean:
+        lean_options(options)
+        capabilities = dict(LEAN_CAPABILITIES)
 
-def thread_proc(params):
-
-    debug = params['debug']
+    # driver = webdriver.Chrome("chromedriver.exe", chrome_options=options)
+    if debug:
+        driver = webdriver.Chrome()
+        driver.set_window_size(0, 0)
+    else:
+        driver = webdriver.Chrome(chrome_options=options, desired_capabilities=capabilities)
 
-    driver = get_driver(debug)
-    get_business_website_url(driver, params)
-    driver.quit()
+    if lean:
+        block_urls(driver)
+    return driver
 
+def thread_proc(params):
 
-def divide_chunks(urls, n):
-    total_count = len(urls)
-    chunk_size = int(total_count / n) + 1
+    get_business_website_url(params)
 
-    for i in range(0, total_count, chunk_size):
-        yield urls[i:i + chunk_size]
 
 class EmailScraper(object):
     # Email scraper
 
-    def __init__(self, domain_name=None):
+    def __init__(self, domain_name=None, page_pool=None, page_slots=None, batch_size=1, parsers=None, span=tracing.NULL):
         self.visited = {'/'}
-        self.extracted_mail = []
+        # dict as an ordered set of the lowercased addresses
+        self.extracted_mail = {}
         self.domain_name = domain_name
         self.dn_as_list = domain_name.split('.')[1:]
         self.cnt = 0
+        # pages that could be fetched
+        self.fetched = 0
+        # pages of the site are fetched batch_size at a time on page_pool
+        self.page_pool = page_pool
+        self.page_slots = page_slots
+        self.batch_size = batch_size
+        # the fetched pages are parsed on parsers, in the page thread when it has no workers
+        self.parsers = parsers
+        if self.parsers is None:
+            self.parsers = ParsePool()
+        # email crawl span of the business, a child span per page
+        self.span = span
+        self.queued = span.span('queued')
+
+    def get_page(self, link):
+        with self.span.span('page', url=link) as page:
+            return self.fetch_page(link, page)
+
+    def fetch_page(self, link, page):
+        # links and emails of the page, the domain slot is only held while fetching
+        start = time.time()
+        if self.page_slots is not None:
+            self.page_slots.acquire()
+        try:
+            with page.span('fetch'):
+                page_html = get_html(link)
+        except:
+            metrics.counter('pages_failed_total', page='site').inc()
+            return None
+        finally:
+            if self.page_slots is not None:
+                self.page_slots.release()
+            metrics.histogram('fetch_seconds', page='site').observe(time.time() - start)
+        metrics.counter('pages_fetched_total', page='site').inc()
+
+        start = time.time()
+        try:
+            with page.span('parse'):
+                links, emails = self.parsers.run(parse_site_page, page_html, self.domain_name, self.dn_as_list)
+        except:
+            return None
+        finally:
+            metrics.histogram('parse_seconds', page='site').observe(time.time() - start)
+        return {'links': links, 'emails': emails}
 
     def extract_mail_add(self):
-        node_list = ['{}'.format(self.domain_name)]
+        # breadth first, so a batch is made of pages at the same depth
+        node_list = deque(['{}'.format(self.domain_name)])
         result = []
-
-        while node_list:
-            current_node = node_list.pop()
-            if current_node not in self.visited:
-                self.visited.add(current_node)
-                try:
-                    r = get_html(current_node)
-                except:
-                    r = None
+        start = time.time()
+        self.queued.close()
+
+        while node_list and self.cnt < MAX_EMAIL_PAGES:
+            batch = []
+            batch_size = min(self.batch_size, MAX_EMAIL_PAGES - self.cnt)
+            while node_list and len(batch) < batch_size:
+                current_node = node_list.popleft()
+                if current_node not in self.visited:
+                    self.visited.add(current_node)
+                    batch.append(current_node)
+            self.cnt = self.cnt + len(batch)
+
+            if self.page_pool is not None:
+                pages = self.page_pool.map(self.get_page, batch)
+            else:
+                pages = map(self.get_page, batch)
+
+            for r in pages:
                 if r:
+                    self.fetched = self.fetched + 1
                     if len(node_list) < 50:
-                        node_list.extend(fetch_links(r['html_lxml'], self.domain_name, self.dn_as_list, self.visited))
-                    for address in find_mail_address(r['html']):
-                        if address.lower() not in self.extracted_mail:
-                            self.extracted_mail.append(address.lower())
-                self.cnt = self.cnt + 1
-            if self.cnt == 30:
-                break
+                        node_list.extend(link for link in r['links'] if link not in self.visited)
+                    self.extracted_mail.update(dict.fromkeys(r['emails']))
         if self.extracted_mail:
+            valid = validate_batch(self.extracted_mail)
             for address in self.extracted_mail:
-                if check_spamtxt(address):
+                if address in valid and not has_spamtrap(address):
                     result.append(address)
         else:
             print('Could not find an email-address on {}!'.format(self.domain_name))
 
+        metrics.histogram('email_crawl_seconds').observe(time.time() - start)
+        metrics.counter('emails_found_total').inc(len(result))
+        self.span.set(pages=self.cnt, fetched=self.fetched, emails=len(result))
         return result
-        
-def check_spamtxt(address):
-    # check spam text
-    global spamtraps
-
-    for spamtrap in spamtraps:
-        if spamtrap.lower() in address.lower():
-            return False
 
-    if is_valid(address):
-        return True
-
-def is_valid(email):
 
-    # check email validation
+class EmailCrawler(object):
+    """
+    Crawls business websites for email addresses in the background.
+    Many sites are crawled at once, and at most pages_per_site pages of
+    the same domain are in flight at the same time.
+    Results are cached per website(site_key), and businesses sharing a
+    website that is being crawled wait for that crawl instead of starting another.
+    At most max_pending crawls(default: 4 per site thread) are running or queued,
+    submit blocks until one is done, so the rows waiting for them stay bounded.
+    """
 
-    regex = '^\w+([\.-]?\w+)*@\w+([\.-]?\w+)*(\.\w{2,3})+$'
-    if(re.search(regex,email)):
-        return True
-    else:
-        return False
+    def __init__(self, sites=8, pages_per_site=4, email_cache=None, parsers=None, max_pending=None):
+        self.site_pool = ThreadPoolExecutor(max_workers=sites)
+        self.pending = threading.BoundedSemaphore(max_pending or sites * 4)
+        self.page_pool = ThreadPoolExecutor(max_workers=sites * pages_per_site)
+        self.pages_per_site = pages_per_site
+        self.domain_slots = {}
+        self.email_cache = email_cache
+        if self.email_cache is None:
+            self.email_cache = DomainEmailCache()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.parsers = parsers
+        # websites being crawled or waiting for a crawl thread
+        metrics.gauge('queue_depth', lambda: len(self.in_flight), queue='email')
+
+    def get_page_slots(self, website_url):
+        domain = urlparse(website_url).netloc.lower()
+        with self.lock:
+            slots = self.domain_slots.get(domain)
+            if slots is None:
+                slots = threading.BoundedSemaphore(self.pages_per_site)
+                self.domain_slots[domain] = slots
+            return slots
+
+    def submit(self, website_url, callback=None, trace=tracing.NULL):
+        """
+        Start crawling the website. Returns the future of the email list, callback gets it when done.
+        The crawl is traced as a span of trace.
+        """
+        site = site_key(website_url)
+        page_slots = self.get_page_slots(website_url)
+        scraper = None
+        span = trace.span('email_crawl', site=site)
+
+        # taken before the lock, it is given back at once when no new crawl is started
+        self.pending.acquire()
+        with self.lock:
+            future = self.in_flight.get(site)
+            if future is None:
+                emails = self.email_cache.get(site)
+                if emails is not None:
+                    span.set(cached=True)
+                    future = Future()
+                    future.set_result(emails)
+                else:
+                    scraper = EmailScraper(website_url, self.page_pool, page_slots, self.pages_per_site, self.parsers, span)
+                    future = self.site_pool.submit(scraper.extract_mail_add)
+                    self.in_flight[site] = future
+            else:
+                # waits for the crawl started by another business
+                span.set(shared=True)
+
+        # registered outside the lock, they run at once when the future is already done
+        if scraper is not None:
+            future.add_done_callback(partial(self.on_crawled, site, scraper))
+        else:
+            self.pending.release()
+        future.add_done_callback(lambda future: span.close())
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
 
+    def on_crawled(self, site, scraper, future):
+        # cache the result unless the site could not be reached at all
 
-def get_html(link=None):
-    # get page source
+        if future.exception() is None and scraper.fetched > 0:
+            self.email_cache.put(site, future.result())
+        with self.lock:
+            self.in_flight.pop(site, None)
+        self.pending.release()
 
-    if link:
-        result = {}
-        headers = {
-            'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/76.0.3809.132 Safari/537.36',
-            'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3',
-        }
-        r = requests.get(link, headers=headers, timeout=60)
-        result['html'] = r.text
-        result['html_lxml'] = BeautifulSoup(r.text, "lxml")
+    def shutdown(self, wait=True):
+        self.site_pool.shutdown(wait)
+        self.page_pool.shutdown(wait)
 
-        return result
 
+def has_spamtrap(address):
+    # check spam text against the matcher set up in main
+    return spamtraps.match(address)
 
-def in_same_domain(source=None, target=None):
-    # check domain status
 
-    if all([type(source) == list, type(target) == str]):
-        return source == urlparse(target).netloc.split('.')[-len(source):]
-    return False
+def check_spamtxt(address):
+    # check spam text and email validation
 
+    if has_spamtrap(address):
+        return False
 
-def find_mail_address(html_corpus=None):
-    # find email address
+    if is_valid(address):
+        return True
 
-    emails = re.findall(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]{2,3}", html_corpus)
-    result = []
-    for email in emails:
-        if email.lower() not in result:
-            result.append(email.lower())
 
-    return result
+def get_html(link=None):
+    # get page source, raw bytes, the page is parsed by parse_site_page
 
+    if link:
+        r = http_client.get(link)
+        return r.content
 
-def fetch_links(html_corpus=None, domain_name=None, dn_as_list=None, visited_links=None):
-    # get links at page
-    
-    links = []
-    if all([html_corpus, domain_name, type(visited_links) == set, type(dn_as_list) == list]):
-        for link in html_corpus.find_all('a'):
-            link = link.get('href', None)
-            if link and not link.startswith('#'):
-                if link.startswith('/'):
-                    to_traverse = "{}{}".format(domain_name, link)
-                    if to_traverse not in visited_links:
-                        links.append(to_traverse)
-                elif '.htm' in link and 'http' not in link:
-                    to_traverse = "{}{}".format(domain_name, link)
-                    if to_traverse not in visited_links:
-                        links.append(to_traverse)                        
-                elif in_same_domain(dn_as_list, link) and link not in visited_links:
-                    links.append(link)
-    return links
 
 if __name__ == "__main__":
 
@@ -358,10 +464,74 @@ if __name__ == "__main__":
                         help='thread count. must be less than 5')
     parser.add_argument('-s', '--secondrate', type=int,
                         help='throttle time between requests in seconds')
+    parser.add_argument('-r', '--rate', type=float,
+                        help='requests per second to yelp.com shared by all threads. default: threads / throttle')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='raise the yelp.com rate while pages come back fine, cut it on block pages, 429/503 and timeouts')
+    parser.add_argument('--min-rate', type=float, help='lowest yelp.com rate of --adaptive. default: rate / 10')
+    parser.add_argument('--max-rate', type=float, help='highest yelp.com rate of --adaptive. default: rate * 4')
+    parser.add_argument('--site-rate', type=float,
+                        help='requests per second to each business website. default: 2')
+    parser.add_argument('--email-sites', type=int,
+                        help='business websites crawled at the same time. default: 8')
+    parser.add_argument('--email-pages', type=int,
+                        help='pages of one website fetched at the same time. default: 4')
+    parser.add_argument('--spamtraps', type=str, default='spamtraps.txt',
+                        help='spamtrap file name. default: spamtraps.txt')
+    parser.add_argument('--spamtrap-reload', type=int, default=60,
+                        help='seconds between checks of the spamtrap file for changes, 0 to disable. default: 60')
+    parser.add_argument('--cache-dir', type=str,
+                        help='directory of the response cache. no cache when not given')
+    parser.add_argument('--cache-ttl', type=int, default=7 * 24 * 3600,
+                        help='seconds a cached response stays valid. default: 604800')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='cache size in MB, least recently used responses are evicted. default: 1024')
+    parser.add_argument('--cache-pages', action='store_true',
+                        help='cache the yelp pages loaded by webdriver too')
+    parser.add_argument('--email-cache', type=str,
+                        help='file of the emails found per website, kept across runs. in memory only when not given')
+    parser.add_argument('--email-cache-ttl', type=int, default=30 * 24 * 3600,
+                        help='seconds the emails of a website stay valid. default: 2592000')
+    parser.add_argument('--browsers', type=int,
+                        help='browsers kept running for the threads. default: thread count')
+    parser.add_argument('--recycle-pages', type=int, default=100,
+                        help='pages a browser loads before it is restarted. default: 100')
+    parser.add_argument('--recycle-memory', type=int, default=0,
+                        help='restart a browser using more MB than this, needs psutil. default: 0(off)')
+    parser.add_argument('--lean', action='store_true',
+                        help='browsers skip images, fonts, css and trackers and return at DOMContentLoaded')
+    parser.add_argument('-f', '--fetch', choices=['browser', 'hybrid'], default='browser',
+                        help='browser: load every page in a browser, hybrid: plain http first, '
+                             'a browser only for the pages without ld+json or blocked. default: browser')
+    parser.add_argument('--fetch-log',
+                        help='file of the fetch path taken per url, hybrid mode')
+    parser.add_argument('--parsers', type=int, default=0,
+                        help='processes parsing the business pages and website pages, 0 parses in the threads. default: 0')
+    parser.add_argument('--flush-rows', type=int, default=100,
+                        help='output rows written and flushed together. default: 100')
+    parser.add_argument('--flush-seconds', type=float, default=1.0,
+                        help='longest time a row waits to be flushed. default: 1')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default='none',
+                        help='fsync the output after every flush, on close, or never. default: none')
+    parser.add_argument('--sink', choices=SINKS, default='csv',
+                        help='output format: csv file, sqlite database(indexed, added to) '
+                             'or parquet file(needs pyarrow). default: csv')
+    parser.add_argument('-j', '--journal',
+                        help='progress journal; a rerun with the same file skips the finished yelp urls')
     parser.add_argument('-v', '--verbose',
                         action='store_true', help='verbose mode')
     parser.add_argument('-d', '--debug',
                          action='store_true', help='debug mode')
+    parser.add_argument('--pool-hosts', type=int,
+                        help='hosts with kept-alive connection pools. default: 100')
+    parser.add_argument('--pool-size', type=int,
+                        help='kept-alive connections per host. default: 16')
+    parser.add_argument('--stats', type=int, default=60,
+                        help='seconds between the stats lines, 0 for none. default: 60')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve the metrics as prometheus text on 127.0.0.1:<port>/metrics')
+    parser.add_argument('--trace',
+                        help='json lines file of the timed spans of each business, see trace_summary.py')
     args = parser.parse_args()
 
     if (args.input is None or args.output is None):
@@ -383,6 +553,23 @@ if __name__ == "__main__":
         if throttle < 1:
             throttle = 1
 
+    # one request budget shared by all threads
+    yelp_rate = threads / throttle
+    if args.rate and args.rate > 0:
+        yelp_rate = args.rate
+
+    site_rate = 2.0
+    if args.site_rate and args.site_rate > 0:
+        site_rate = args.site_rate
+
+    email_sites = 8
+    if args.email_sites and args.email_sites > 0:
+        email_sites = args.email_sites
+
+    email_pages = 4
+    if args.email_pages and args.email_pages > 0:
+        email_pages = args.email_pages
+
     verbose = False
     if args.verbose:
         verbose = True
@@ -391,53 +578,136 @@ if __name__ == "__main__":
     if args.debug:
         debug = True
 
+    browser_count = threads
+    if args.browsers and args.browsers > 0:
+        browser_count = args.browsers
+
     if verbose:
-        print("Parameter", args.input, args.output, threads, throttle, verbose, debug)
+        print("Parameter", args.input, args.output, threads, throttle, yelp_rate, site_rate, verbose, debug)
+
+    # the parser processes are started before the threads of the script
+    parsers = ParsePool(max(0, args.parsers))
+    parsers.start()
 
-    global spamtraps
-    with open("spamtraps.txt", "r", encoding='utf-8') as search_f:
-        spamtraps = [line.strip() for line in search_f.readlines()]
+    adaptive = None
+    if args.adaptive:
+        adaptive = (args.min_rate or yelp_rate / 10.0, args.max_rate or yelp_rate * 4)
+    limiter = RateLimiter(yelp_rate, site_rate, adaptive=adaptive)
+
+    cache = None
+    if args.cache_dir:
+        cache = HttpCache(args.cache_dir, args.cache_ttl, args.cache_size * 1024 * 1024)
+
+    page_cache = None
+    if args.cache_pages:
+        page_cache = cache
+
+    http_client.configure(pool_hosts=args.pool_hosts, pool_size=args.pool_size, limiter=limiter, response_cache=cache)
+
+    # compiled once, reloaded when the file changes during the run
+    spamtraps = SpamtrapMatcher(args.spamtraps, args.spamtrap_reload)
 
     # signal handlers
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
 
+    journal = None
+    if args.journal:
+        journal = ProgressJournal(args.journal)
+        if journal.resuming() and args.sink == 'parquet':
+            print ("A parquet file can not be added to, resume with --sink csv or sqlite!")
+            sys.exit(0)
+
     with open(args.input, "r", encoding='utf-8') as fInput:
-        with open(args.output, "w", encoding='utf-8', newline='') as fOutput:
-
-            # write csv header
-            myFields = ['Business Name', 'Category', 'Yelp Rating', 'Price Range', 'Phone Number',
-                        'Address', 'Email', 'Claimed', 'Number of Reviews', 'Website URL', 'Yelp URL']
-            writer = csv.writer(fOutput)
-            writer.writerow(myFields)
-
-            # read urls from the input file
-            url_list = [line.strip() for line in fInput.readlines()]
-            if verbose:
-                print("Total count =", len(url_list))
-
-            # make parameters for the thread
-            params = []
-            url_chunks = list(divide_chunks(url_list, threads))
-            for i in range(threads):
-                param = {
-                    "urls": url_chunks[i],
-                    "throttle": throttle,
-                    "output": fOutput,
-                    "verbose": verbose,
-                    "debug": debug
-                }
-                params.append(param)
-
-            # run threads to process yelp pages
-            try:
-                pool = ThreadPool(threads)
-                result = pool.map(thread_proc, params)
 
-                pool.close()
-                pool.join()
+        # one thread writes the rows of all threads, a resumed run adds to the output
+        sink = open_sink(args.sink, args.output, OUTPUT_FIELDS, journal is not None and journal.resuming())
+        output = OutputWriter(sink, args.flush_rows, args.flush_seconds, args.fsync)
+
+        # read urls from the input file
+        url_list = [line.strip() for line in fInput.readlines()]
+        if verbose:
+            print("Total count =", len(url_list))
+
+        if journal is not None and journal.resuming():
+            url_list = [url for url in url_list if not journal.is_done(url)]
+            print("Resuming, {} urls left".format(len(url_list)))
+
+        # email crawls of all threads share one crawler
+        email_cache = DomainEmailCache(args.email_cache, args.email_cache_ttl)
+        crawler = EmailCrawler(email_sites, email_pages, email_cache, parsers)
+
+        # browsers are shared by the threads
+        browsers = BrowserPool(partial(get_driver, debug, args.lean), browser_count,
+                               args.recycle_pages, args.recycle_memory, verbose)
+        page_stats = PageStats()
+        fetch = partial(load_page, browsers, limiter=limiter, cache=page_cache, stats=page_stats)
 
-            except ProgramKilled:
+        if args.fetch == 'hybrid':
+            # browsers are only started for the pages plain http can not get
+            fetch = HybridFetcher(fetch, cache, args.fetch_log)
+        else:
+            browsers.start()
+
+        # make parameters for the thread
+        params = []
+        job_queue = JobQueue(url_list)
+        for i in range(threads):
+            param = {
+                "urls": job_queue.jobs("worker-{}".format(i + 1)),
+                "fetch": fetch,
+                "output": output,
+                "crawler": crawler,
+                "journal": journal,
+                "parsers": parsers,
+                "verbose": verbose,
+                "debug": debug
+            }
+            params.append(param)
+
+        # stats line and metrics endpoint for the run
+        metrics.start(args.stats, args.metrics_port)
+        if args.trace:
+            tracing.configure(args.trace)
+
+        # run threads to process yelp pages
+        pool = None
+        killed = False
+        try:
+            pool = ThreadPool(threads)
+            result = pool.map(thread_proc, params)
+
+            pool.close()
+            pool.join()
+            job_queue.report()
+
+        except ProgramKilled:
+            killed = True
+            if pool is not None:
                 pool.close()
                 pool.join()
-                exit(0)
+
+        finally:
+            # also after a crash, so no browser or crawl thread is left running and the
+            # rows queued before it still reach the file. a finished run waits for the
+            # websites still being crawled
+            browsers.shutdown()
+            crawler.shutdown(wait=not killed)
+            parsers.shutdown(wait=not killed)
+            if args.fetch == 'hybrid':
+                fetch.close()
+            output.close()
+            metrics.stop()
+            tracing.close()
+            if journal is not None:
+                journal.close()
+
+        if killed:
+            exit(0)
+        browsers.report()
+        page_stats.report()
+        limiter.report()
+        if args.fetch == 'hybrid':
+            fetch.report()
+        output.report()
+        metrics.report()
@@ -1,27 +1,27 @@
 from multiprocessing.pool import ThreadPool, Pool
-import requests
+import http_client
+import metrics
+import tracing
+from http_cache import HttpCache
+from scheduler import JobQueue
+from rate_limiter import RateLimiter
+from output_writer import OutputWriter, FSYNC_POLICIES
+from result_sink import LineSink
+from parse_pool import ParsePool
 import sys
 import threading
 import argparse
 import time, signal
-from bs4 import BeautifulSoup
+import biz_parser
 import random
 import json
+import requests
+from functools import partial
 from urllib.parse import unquote
 
 
 RATING_THRESHOLD = 3.5
 
-headers = {'Accept':'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-    'Accept-Encoding':'gzip, deflate, br',
-    'Accept-Language':'en-GB,en;q=0.9,en-US;q=0.8,ml;q=0.7',
-    'Cache-Control':'max-age=0',
-    'Connection':'keep-alive',
-    'Host':'www.yelp.com',
-    'Upgrade-Insecure-Requests':'1',
-    'User-Agent':'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/64.0.3282.140 Safari/537.36'
-}
-
     
 class ProgramKilled(Exception):
     pass
@@ -32,104 +32,111 @@ def signal_handler(signum, frame):
 def wait_for(min, max):
     time.sleep(random.uniform(min, max))
 
-def get_substring(instr, startstr, endstr=None):
+def parse_business_page(text, page_url, verbose, parsers=None):
     """
-    Get sub string between the start and end string
+    Get the business website url from the page when its rating is low enough.
+    Kept pages are parsed on parsers when given.
     """
-    if startstr == "":
-        length = instr.find(endstr)
-        if length >= 0:
-            return instr[:length]
+    # the rating is read from the raw page, only kept pages are parsed
+    ratingValue = biz_parser.get_rating(text)
+    if ratingValue is None:
+        metrics.counter('pages_rejected_total', reason='no_rating').inc()
+        return ""
+
+    if verbose == True:
+        print ("Rating Value :", ratingValue, page_url)
 
-    start_idx = instr.find(startstr)
-    if start_idx == -1:
+    if ratingValue > RATING_THRESHOLD:
+        metrics.counter('pages_rejected_total', reason='rating').inc()
         return ""
-    start_idx += len(startstr)
-    if start_idx >= 0:
-        if endstr:
-            length = instr[start_idx:].find(endstr)
-            if length == -1:
-                return instr[start_idx:]                            
-            return instr[start_idx:start_idx+length]
-        return instr[start_idx:]
-    
+
+    # biz_website_span = soup.find("span", {"class", "biz-website"})
+    # if biz_website_span == None:
+    #     if verbose == True:
+    #         print ("There is no business website")
+    #     return ""
+
+    start = time.time()
+    if parsers is not None:
+        website_url = parsers.run(biz_parser.extract_website_url, text)
+    else:
+        website_url = biz_parser.extract_website_url(text)
+    metrics.histogram('parse_seconds', page='biz').observe(time.time() - start)
+    if website_url != "":
+        print ("Business website :", website_url)
+
+    if website_url == "" and verbose == True:
+        print ("There is no business website.")
+
+    return website_url
+
 
 def get_business_website_url(params):
     
     page_urls   = params['urls']
-    throttle    = params['throttle']
-    output_file = params['output']
+    output      = params['output']
+    parsers     = params['parsers']
     verbose     = params['verbose']
     
     for page_url in page_urls:
 
-        response = requests.get(page_url, headers=headers)
-        if response.status_code==200:
-            soup = BeautifulSoup(response.text, 'lxml')
+        trace = tracing.begin(page_url)
+        start = time.time()
+        try:
+            with trace.span('fetch'):
+                response = http_client.get(page_url, headers=http_client.YELP_HEADERS)
+        except requests.RequestException as e:
+            # a connection error or timeout fails the page, not the thread
+            if verbose == True:
+                print ("Request failed :", page_url, repr(e))
+            metrics.counter('pages_failed_total', page='biz').inc()
+            trace.finish('failed')
+            continue
+        metrics.histogram('fetch_seconds', page='biz').observe(time.time() - start)
+        if response.status_code != 200:
+            metrics.counter('pages_failed_total', page='biz').inc()
+            trace.finish('failed', status_code=response.status_code)
+            continue
 
-            jsonItems = soup.findAll("script", {"type": "application/ld+json"})
-            if len(jsonItems) == 0:
-                wait_for(throttle - 0.5, throttle + 0.5)
-                continue
-            
-            bizItem = jsonItems[-1]
-            jsonTxt = bizItem.text.strip()
-            bizObj = json.loads(jsonTxt)
-            
-            ratingValue = 5.0
-            if 'aggregateRating' in bizObj:
-                if 'ratingValue' in bizObj['aggregateRating']:
-                    ratingValue = float(bizObj['aggregateRating']['ratingValue'])
+        metrics.counter('pages_fetched_total', page='biz').inc()
+        try:
+            with trace.span('parse'):
+                website_url = parse_business_page(response.text, page_url, verbose, parsers)
+        except biz_parser.PAGE_ERRORS as e:
+            # a malformed page fails alone, the thread goes on with the next one
+            print ("Could not parse the page :", page_url, repr(e))
+            metrics.counter('pages_failed_total', page='biz').inc()
+            trace.finish('failed', error=repr(e))
+            continue
+        write_website(output, website_url, trace)
 
-            if verbose == True:
-                print ("Rating Value :", ratingValue, page_url)
-                
-            if ratingValue > RATING_THRESHOLD:
-                wait_for(throttle - 0.5, throttle + 0.5)
-                continue
-            
-            # biz_website_span = soup.find("span", {"class", "biz-website"})
-            # if biz_website_span == None:
-            #     if verbose == True:
-            #         print ("There is no business website")
-            #     wait_for(throttle - 0.5, throttle + 0.5)
-            #     continue
-            
-            website_url = ""
-            biz_website_link = soup.find('a', {'rel': 'noopener'})
-            # biz_website_link = biz_website_span.find("a", {"rel": "noopener nofollow"})
-            if biz_website_link:
-                website_url = biz_website_link['href']
-                website_url = get_substring(website_url, "url=", "&website")
-                if website_url != "":
-                    website_url = unquote(website_url)
-                    print ("Business website :", website_url)
-                
-                    output_file.write(website_url)
-                    output_file.write("\n")
-                    
-            if website_url == "" and verbose == True:
-                print ("There is no business website.")
-
-            wait_for(throttle - 0.5, throttle + 0.5)
+
+def write_website(output, website_url, trace=tracing.NULL):
+    # queue the website url, the trace of the page ends once it is on disk
+    if website_url == "":
+        trace.finish('skipped')
+        return
+
+    on_written = None
+    if trace:
+        on_written = partial(website_written, trace, trace.span('output_write'))
+    output.write([website_url], on_written)
+
+
+def website_written(trace, write_span):
+    write_span.close()
+    trace.finish('written')
     
 
 def thread_proc(params):
     get_business_website_url(params)
     
     
-def divide_chunks(urls, n):
-    total_count = len(urls)
-    chunk_size = int(total_count / n) + 1
-    
-    for i in range(0, total_count, chunk_size):  
-        yield urls[i:i + chunk_size]
-        
-
 if __name__ == "__main__":
 
     """
     Command : python yelp_proc.py -i input.txt -o output.txt -t 3 -s 1 -v
+    Command(async) : python yelp_proc_req.py -i input.txt -o output.txt -m async -c 200 -s 1 -v
     """
 
     parser = argparse.ArgumentParser(description='Extracts business website urls which have rating value \
@@ -138,8 +145,25 @@ if __name__ == "__main__":
     parser.add_argument('-o', '--output', type=str, help='output file name(wesite url in each row)')
     parser.add_argument('-t', '--threads', type=int, help='thread count. must be less than 5')
     parser.add_argument('-s', '--secondrate', type=int, help='throttle time between requests in seconds')
+    parser.add_argument('-r', '--rate', type=float, help='requests per second to yelp.com shared by all workers, also in async mode. default: threads / throttle')
+    parser.add_argument('--flush-rows', type=int, default=100, help='output lines written and flushed together. default: 100')
+    parser.add_argument('--flush-seconds', type=float, default=1.0, help='longest time a line waits to be flushed. default: 1')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default='none', help='fsync the output after every flush, on close, or never. default: none')
+    parser.add_argument('--adaptive', action='store_true', help='raise the rate while pages come back fine, cut it on block pages, 429/503 and timeouts')
+    parser.add_argument('--min-rate', type=float, help='lowest rate of --adaptive. default: rate / 10')
+    parser.add_argument('--max-rate', type=float, help='highest rate of --adaptive. default: rate * 4')
     parser.add_argument('-v', '--verbose', action='store_true', help='verbose mode')
-    
+    parser.add_argument('-m', '--mode', type=str, choices=['threads', 'async'], default='threads', help='fetch engine. default: threads')
+    parser.add_argument('-c', '--concurrency', type=int, help='requests in flight in async mode. default: 100')
+    parser.add_argument('--parsers', type=int, default=0, help='processes parsing the kept business pages, 0 parses in the workers. default: 0')
+    parser.add_argument('--pool-hosts', type=int, help='hosts with kept-alive connection pools. default: 100')
+    parser.add_argument('--pool-size', type=int, help='kept-alive connections per host. default: 16')
+    parser.add_argument('--cache-dir', type=str, help='directory of the response cache. no cache when not given')
+    parser.add_argument('--cache-ttl', type=int, default=7 * 24 * 3600, help='seconds a cached response stays valid. default: 604800')
+    parser.add_argument('--cache-size', type=int, default=1024, help='cache size in MB, least recently used responses are evicted. default: 1024')
+    parser.add_argument('--stats', type=int, default=60, help='seconds between the stats lines, 0 for none. default: 60')
+    parser.add_argument('--metrics-port', type=int, help='serve the metrics as prometheus text on 127.0.0.1:<port>/metrics')
+    parser.add_argument('--trace', help='json lines file of the timed spans of each url, see trace_summary.py')
 
     args = parser.parse_args()
     
@@ -162,12 +186,39 @@ if __name__ == "__main__":
         if throttle < 1:
             throttle = 1
             
+    concurrency = 100
+    if args.concurrency:
+        concurrency = int(args.concurrency)
+        if concurrency < 1:
+            concurrency = 1
+
+    # one request budget shared by all workers. async mode keeps the pace of the threads,
+    # many requests in flight only go faster with an explicit -r
+    rate = threads / throttle
+    if args.rate and args.rate > 0:
+        rate = args.rate
+
     verbose = False
     if args.verbose:
         verbose = True
         
     if verbose:
-        print ("Parameter", args.input, args.output, threads, throttle, verbose)
+        print ("Parameter", args.input, args.output, args.mode, threads, concurrency, throttle, rate, verbose)
+
+    # the parser processes are started before the threads of the script
+    parsers = ParsePool(max(0, args.parsers))
+    parsers.start()
+
+    adaptive = None
+    if args.adaptive:
+        adaptive = (args.min_rate or rate / 10.0, args.max_rate or rate * 4)
+    limiter = RateLimiter(rate, rate, adaptive=adaptive)
+
+    cache = None
+    if args.cache_dir:
+        cache = HttpCache(args.cache_dir, args.cache_ttl, args.cache_size * 1024 * 1024)
+
+    http_client.configure(pool_hosts=args.pool_hosts, pool_size=args.pool_size, limiter=limiter, response_cache=cache)
         
         
     # signal handlers
@@ -182,27 +233,64 @@ if __name__ == "__main__":
             if verbose:
                 print ("Url count =", len(url_list))
 
-            # make parameters for the thread
-            params = []
-            url_chunks = list(divide_chunks(url_list, threads))
-            for i in range(threads):
-                param = {
-                    "urls": url_chunks[i],
-                    "throttle": throttle,
-                    "output": fOutput,
-                    "verbose": verbose
-                }
-                params.append(param)
-            
-            # run threads to process yelp pages
+            # one thread writes the lines of all workers
+            output = OutputWriter(LineSink(fOutput), args.flush_rows, args.flush_seconds, args.fsync)
+
+            # stats line and metrics endpoint for the run
+            metrics.start(args.stats, args.metrics_port)
+            if args.trace:
+                tracing.configure(args.trace)
+
+            # run the workers to process yelp pages
+            pool = None
+            killed = False
             try:
-                pool = ThreadPool(threads)
-                result = pool.map(thread_proc, params)
-                
-                pool.close()
-                pool.join()
-                
+                if args.mode == 'async':
+                    from async_engine import run_async
+
+                    param = {
+                        "urls": url_list,
+                        "limiter": limiter,
+                        "output": output,
+                        "parsers": parsers,
+                        "verbose": verbose
+                    }
+                    run_async(param, concurrency, partial(parse_business_page, parsers=parsers), write_website)
+                else:
+                    # make parameters for the thread
+                    params = []
+                    job_queue = JobQueue(url_list)
+                    for i in range(threads):
+                        param = {
+                            "urls": job_queue.jobs("worker-{}".format(i + 1)),
+                            "output": output,
+                            "parsers": parsers,
+                            "verbose": verbose
+                        }
+                        params.append(param)
+
+                    pool = ThreadPool(threads)
+                    result = pool.map(thread_proc, params)
+
+                    pool.close()
+                    pool.join()
+                    job_queue.report()
+
             except ProgramKilled:
-                pool.close()
-                pool.join()
-                exit(0)
+                killed = True
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+
+            finally:
+                # also after a crash, so the rows queued before it still reach the file
+                parsers.shutdown(wait=not killed)
+                output.close()
+                metrics.stop()
+                tracing.close()
+
+            if killed:
+                sys.exit(0)
+            output.report()
+            limiter.report()
+            metrics.report()